@@ -5,19 +5,67 @@ Markdown转政府公文格式 - Web服务后端
 提供文件上传和文本转换API
 """
 
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, Response, request, send_file, jsonify, stream_with_context
 from flask_cors import CORS
+from urllib.parse import quote
+import io
 import os
-import tempfile
-from pathlib import Path
-from md2gov_docx import convert_markdown_to_gov_docx
-import uuid
+from md2gov_docx import iter_docx_chunks, iter_markdown_lines, iter_batch_zip, parse_markdown, render_blocks
+from conversion_cache import ConversionCache, DEFAULT_MEMORY_BYTES, DEFAULT_DISK_BYTES
+from conversion_stats import ConversionStats, ConversionMetrics, METRICS_PREFIX, format_metric
+from job_queue import (JobQueue, QueueFullError, JOB_DONE, JOB_FAILED,
+                       DEFAULT_WORKERS, DEFAULT_QUEUE_SIZE, DEFAULT_RESULT_TTL)
+from worker_pool import (ConversionWorkerPool, WorkerPoolBusyError, WorkerTimeoutError,
+                         DEFAULT_JOB_TIMEOUT, DEFAULT_MAX_JOBS_PER_WORKER)
 
 app = Flask(__name__, static_folder='static')
 CORS(app)  # 允许跨域请求
 
-# 临时文件目录
-TEMP_DIR = tempfile.gettempdir()
+# 转换结果缓存（相同内容重复提交直接返回）
+# MD2GOV_CACHE_DIR 为空时只使用内存层
+conversion_cache = ConversionCache(
+    max_memory_bytes=int(os.environ.get('MD2GOV_CACHE_MEMORY_MB', DEFAULT_MEMORY_BYTES // 1024 // 1024)) * 1024 * 1024,
+    disk_dir=os.environ.get('MD2GOV_CACHE_DIR') or None,
+    max_disk_bytes=int(os.environ.get('MD2GOV_CACHE_DISK_MB', DEFAULT_DISK_BYTES // 1024 // 1024)) * 1024 * 1024
+)
+
+# 转换性能指标（各阶段耗时、块/Run/表格计数），由 /metrics 导出
+conversion_metrics = ConversionMetrics()
+
+# 常驻转换进程池（生产部署）：MD2GOV_POOL_WORKERS 大于0时启用，
+# 转换交给已预热的工作进程，并发请求不再争用Web进程的GIL；为0时在请求线程中直接转换
+pool_workers = int(os.environ.get('MD2GOV_POOL_WORKERS', 0))
+worker_pool = ConversionWorkerPool(
+    workers=pool_workers,
+    timeout=int(os.environ.get('MD2GOV_POOL_TIMEOUT', DEFAULT_JOB_TIMEOUT)),
+    max_jobs_per_worker=int(os.environ.get('MD2GOV_POOL_MAX_JOBS', DEFAULT_MAX_JOBS_PER_WORKER))
+) if pool_workers > 0 else None
+converter = worker_pool.convert if worker_pool is not None else None
+
+# 异步转换任务队列（大文档转换不占用请求线程）
+job_queue = JobQueue(
+    workers=int(os.environ.get('MD2GOV_JOB_WORKERS', DEFAULT_WORKERS)),
+    max_queue=int(os.environ.get('MD2GOV_JOB_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)),
+    result_ttl=int(os.environ.get('MD2GOV_JOB_RESULT_TTL', DEFAULT_RESULT_TTL)),
+    cache=conversion_cache,
+    metrics=conversion_metrics,
+    converter=converter
+)
+
+# Word文档MIME类型
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# 批量转换单次最多上传的文件数
+MAX_BATCH_FILES = int(os.environ.get('MD2GOV_BATCH_MAX_FILES', 100))
+
+# Prometheus文本格式的MIME类型
+METRICS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 预览接口支持的输出格式 -> MIME类型
+PREVIEW_MIMETYPES = {'html': 'text/html; charset=utf-8', 'text': 'text/plain; charset=utf-8'}
+
+# 流式接口可直接接收的请求体类型（请求体即Markdown原文）
+MARKDOWN_MIMETYPES = ('text/markdown', 'text/x-markdown', 'text/plain')
 
 
 @app.route('/')
@@ -26,77 +74,293 @@ def index():
     return app.send_static_file('index.html')
 
 
-@app.route('/api/convert', methods=['POST'])
-def convert_markdown():
+def read_markdown_input():
     """
-    转换Markdown到Word文档
+    从请求中读取Markdown内容
     支持两种方式：
     1. 上传文件 (file)
     2. 直接提交文本内容 (text)
+    
+    返回:
+        (Markdown文本, None) 或 (None, 错误响应)
     """
-    try:
-        # 生成唯一的文件名
-        file_id = str(uuid.uuid4())
-        input_path = os.path.join(TEMP_DIR, f"{file_id}.md")
-        output_path = os.path.join(TEMP_DIR, f"{file_id}.docx")
-        
-        # 处理文件上传
-        if 'file' in request.files:
-            file = request.files['file']
-            if file.filename == '':
-                return jsonify({'error': '未选择文件'}), 400
-            
-            # 保存上传的文件
-            file.save(input_path)
-        
-        # 处理文本内容
-        elif 'text' in request.form:
-            text_content = request.form['text']
-            if not text_content.strip():
-                return jsonify({'error': '文本内容不能为空'}), 400
-            
-            # 保存文本到临时文件
-            with open(input_path, 'w', encoding='utf-8') as f:
-                f.write(text_content)
+    # 处理文件上传
+    if 'file' in request.files:
+        file = request.files['file']
+        if file.filename == '':
+            return None, (jsonify({'error': '未选择文件'}), 400)
         
-        else:
-            return jsonify({'error': '请提供文件或文本内容'}), 400
-        
-        # 转换文档
-        success = convert_markdown_to_gov_docx(input_path, output_path)
+        try:
+            return file.read().decode('utf-8'), None
+        except UnicodeDecodeError:
+            return None, (jsonify({'error': '文件编码错误，请使用UTF-8编码'}), 400)
+    
+    # 处理文本内容
+    if 'text' in request.form:
+        text_content = request.form['text']
+        if not text_content.strip():
+            return None, (jsonify({'error': '文本内容不能为空'}), 400)
+        return text_content, None
+    
+    return None, (jsonify({'error': '请提供文件或文本内容'}), 400)
+
+
+def read_markdown_lines():
+    """
+    从请求中按行读取Markdown内容
+    以text/markdown请求体直接提交原文时，边读取请求体边产出文本行，不把全文读入内存；
+    multipart上传的文件已由Werkzeug完整接收，且视图返回后即被关闭，仍整体读取
+    
+    返回:
+        (文本行生成器, None) 或 (None, 错误响应)
+    """
+    if request.mimetype in MARKDOWN_MIMETYPES:
+        return iter_markdown_lines(request.stream), None
+    
+    text_content, error_response = read_markdown_input()
+    if error_response is not None:
+        return None, error_response
+    return iter_markdown_lines(text_content), None
+
+
+@app.route('/api/convert', methods=['POST'])
+def convert_markdown():
+    """
+    转换Markdown到Word文档（同步返回文件）
+    支持上传文件 (file) 或直接提交文本内容 (text)
+    """
+    try:
+        text_content, error_response = read_markdown_input()
+        if error_response is not None:
+            return error_response
         
-        if not success:
+        # 转换文档（全程在内存中完成，命中缓存时直接返回）
+        stats = ConversionStats()
+        try:
+            docx_data = conversion_cache.get_or_convert(text_content, stats=stats, converter=converter)
+        except WorkerPoolBusyError:
+            response = jsonify({'error': '服务繁忙，请稍后重试'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        except WorkerTimeoutError:
+            conversion_metrics.observe_failure()
+            return jsonify({'error': '转换超时，请拆分文档或使用异步任务接口'}), 504
+        except Exception:
+            conversion_metrics.observe_failure()
             return jsonify({'error': '转换失败，请检查Markdown格式'}), 500
         
         # 返回生成的文件
         response = send_file(
-            output_path,
+            io.BytesIO(docx_data),
             as_attachment=True,
             download_name='公文格式文档.docx',
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+            mimetype=DOCX_MIMETYPE
         )
-        
-        # 清理临时文件（在后台）
-        @response.call_on_close
-        def cleanup():
-            try:
-                if os.path.exists(input_path):
-                    os.remove(input_path)
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-            except:
-                pass
-        
+        if stats.finished:
+            conversion_metrics.observe(stats)
+            response.headers['Server-Timing'] = server_timing_header(stats)
         return response
         
     except Exception as e:
         return jsonify({'error': f'服务器错误: {str(e)}'}), 500
 
 
+@app.route('/api/preview', methods=['POST'])
+def preview_markdown():
+    """
+    公文格式预览：参数同 /api/convert，format为html（默认，完整HTML页面）或text（纯文本）
+    由解析结果直接生成，不构建Word文档，适合边输入边刷新
+    """
+    fmt = request.values.get('format', 'html')
+    if fmt not in PREVIEW_MIMETYPES:
+        return jsonify({'error': f'不支持的预览格式: {fmt}'}), 400
+    
+    text_content, error_response = read_markdown_input()
+    if error_response is not None:
+        return error_response
+    
+    try:
+        content = render_blocks(parse_markdown(text_content), fmt)
+    except Exception:
+        return jsonify({'error': '预览失败，请检查Markdown格式'}), 500
+    return Response(content, content_type=PREVIEW_MIMETYPES[fmt])
+
+
+def server_timing_header(stats):
+    """把各阶段耗时写成Server-Timing响应头（毫秒），浏览器开发者工具可直接查看"""
+    return ', '.join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stats.stage_seconds.items())
+
+
+def observe_stream(chunks, stats):
+    """透传流式响应的数据块，生成结束后累计转换指标"""
+    try:
+        yield from chunks
+    except Exception:
+        conversion_metrics.observe_failure()
+        raise
+    conversion_metrics.observe(stats)
+
+
+@app.route('/api/convert/stream', methods=['POST'])
+def convert_markdown_stream():
+    """
+    流式转换Markdown到Word文档
+    参数同 /api/convert，也可直接以text/markdown请求体提交原文；
+    边读取边转换边发送，适合超大文档，响应开始发送后无法再返回错误状态码
+    """
+    lines, error_response = read_markdown_lines()
+    if error_response is not None:
+        return error_response
+    
+    filename = quote('公文格式文档.docx')
+    # 请求体在响应生成过程中才逐行读取，需保持请求上下文
+    stats = ConversionStats()
+    return Response(
+        stream_with_context(observe_stream(iter_docx_chunks(lines, stats=stats), stats)),
+        mimetype=DOCX_MIMETYPE,
+        headers={'Content-Disposition': f"attachment; filename=document.docx; filename*=UTF-8''{filename}"}
+    )
+
+
+def convert_for_batch(text, use_styles=False, stats=None):
+    """批量转换中的单篇转换：经过缓存和进程池，并累计转换指标"""
+    stats = stats if stats is not None else ConversionStats()
+    try:
+        data = conversion_cache.get_or_convert(text, use_styles, stats, converter)
+    except Exception:
+        conversion_metrics.observe_failure()
+        raise
+    if stats.finished:
+        conversion_metrics.observe(stats)
+    return data
+
+
+@app.route('/api/convert/batch', methods=['POST'])
+def convert_markdown_batch():
+    """
+    批量转换：上传多个Markdown文件 (files)，返回包含全部Word文档的ZIP压缩包
+    各文件并行转换，每篇完成后立即写入压缩包并发送；
+    个别文件转换失败不影响其他文件，失败原因记录在压缩包内的转换失败清单中
+    """
+    uploads = [upload for upload in request.files.getlist('files') if upload.filename]
+    if not uploads:
+        return jsonify({'error': '请选择要转换的文件'}), 400
+    if len(uploads) > MAX_BATCH_FILES:
+        return jsonify({'error': f'单次最多转换{MAX_BATCH_FILES}个文件'}), 400
+    
+    # 上传文件在视图返回后即被关闭，先读出文本
+    documents = []
+    for upload in uploads:
+        try:
+            documents.append((upload.filename, upload.read().decode('utf-8')))
+        except UnicodeDecodeError:
+            return jsonify({'error': f'文件编码错误，请使用UTF-8编码: {upload.filename}'}), 400
+    
+    filename = quote('公文格式文档.zip')
+    return Response(
+        stream_with_context(iter_batch_zip(documents, converter=convert_for_batch,
+                                           max_workers=worker_pool.workers if worker_pool is not None else None)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f"attachment; filename=documents.zip; filename*=UTF-8''{filename}"}
+    )
+
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """
+    提交异步转换任务
+    参数同 /api/convert，立即返回任务ID；队列已满时返回429
+    """
+    text_content, error_response = read_markdown_input()
+    if error_response is not None:
+        return error_response
+    
+    try:
+        job = job_queue.submit(text_content)
+    except QueueFullError:
+        response = jsonify({'error': '任务队列已满，请稍后重试'})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    
+    body = job.to_dict()
+    body['status_url'] = f'/api/jobs/{job.id}'
+    body['result_url'] = f'/api/jobs/{job.id}/result'
+    return jsonify(body), 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态和进度"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """下载任务生成的Word文档"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    if job.status == JOB_FAILED:
+        return jsonify({'error': '转换失败，请检查Markdown格式', 'detail': job.error}), 500
+    if job.status != JOB_DONE:
+        return jsonify({'error': '任务尚未完成', 'status': job.status, 'progress': job.progress}), 409
+    
+    return send_file(
+        io.BytesIO(job.result),
+        as_attachment=True,
+        download_name='公文格式文档.docx',
+        mimetype=DOCX_MIMETYPE
+    )
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
-    return jsonify({'status': 'ok', 'message': '服务运行正常'})
+    return jsonify({
+        'status': 'ok',
+        'message': '服务运行正常',
+        'cache': conversion_cache.stats(),
+        'jobs': job_queue.stats(),
+        'pool': worker_pool.stats() if worker_pool is not None else None
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus格式的指标：转换耗时与计数、缓存命中、任务队列状态"""
+    cache_stats = conversion_cache.stats()
+    job_stats = job_queue.stats()
+    parts = [
+        conversion_metrics.render(),
+        format_metric(f"{METRICS_PREFIX}_cache_hits_total", 'counter', '转换缓存命中次数',
+                      [({'tier': 'memory'}, cache_stats['memory_hits']),
+                       ({'tier': 'disk'}, cache_stats['disk_hits'])]),
+        format_metric(f"{METRICS_PREFIX}_cache_misses_total", 'counter', '转换缓存未命中次数',
+                      [(None, cache_stats['misses'])]),
+        format_metric(f"{METRICS_PREFIX}_cache_bytes", 'gauge', '转换缓存占用字节数',
+                      [({'tier': 'memory'}, cache_stats['memory_bytes']),
+                       ({'tier': 'disk'}, cache_stats['disk_bytes'])]),
+        format_metric(f"{METRICS_PREFIX}_jobs", 'gauge', '各状态的异步任务数',
+                      [({'status': status}, count) for status, count in job_stats.items()
+                       if status != 'pending']),
+        format_metric(f"{METRICS_PREFIX}_job_queue_pending", 'gauge', '等待执行的异步任务数',
+                      [(None, job_stats['pending'])]),
+    ]
+    if worker_pool is not None:
+        pool_stats = worker_pool.stats()
+        parts += [
+            format_metric(f"{METRICS_PREFIX}_pool_workers", 'gauge', '转换进程池的工作进程数',
+                          [({'state': 'total'}, pool_stats['workers']),
+                           ({'state': 'idle'}, pool_stats['idle'])]),
+            format_metric(f"{METRICS_PREFIX}_pool_timeouts_total", 'counter', '转换进程池的超时任务数',
+                          [(None, pool_stats['timeouts'])]),
+            format_metric(f"{METRICS_PREFIX}_pool_recycled_total", 'counter', '达到任务数上限后重启的工作进程数',
+                          [(None, pool_stats['recycled'])]),
+        ]
+    return Response(''.join(parts), content_type=METRICS_MIMETYPE)
 
 
 if __name__ == '__main__':
@@ -109,4 +373,5 @@ if __name__ == '__main__':
     print("\n服务地址: http://localhost:5000")
     print("按 Ctrl+C 停止服务\n")
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # 启用进程池时关闭调试模式（调试模式的自动重载会重复创建进程池）
+    app.run(debug=worker_pool is None, host='0.0.0.0', port=5000)
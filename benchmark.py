@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown转政府公文格式 - 性能基准测试
+生成可复现的合成公文Markdown语料，分阶段计时（读取、分词、构建文档、保存），
+记录峰值内存，结果输出为JSON，便于在不同版本之间比较
+"""
+
+import argparse
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows没有resource模块，不统计峰值内存
+    resource = None
+
+import docx
+
+from md2gov_docx import (OUTPUT_FORMAT_VERSION, BLOCK_LIST_ITEM, BLOCK_PARAGRAPH,
+                         add_block_text, add_block_to_doc, is_plain_text, new_gov_document,
+                         parse_inline_format, tokenize_markdown)
+
+# ==================== 默认参数 ====================
+DEFAULT_SIZES = (200, 2000)         # 语料规模（块数）
+DEFAULT_HEADING_DENSITY = 0.15      # 标题块占比
+DEFAULT_LIST_RATIO = 0.2            # 列表项占比
+DEFAULT_TABLE_EVERY = 50            # 每多少个块插入一张表格，0表示不插入表格
+DEFAULT_TABLE_ROWS = 20
+DEFAULT_TABLE_COLS = 5
+DEFAULT_INLINE_DENSITY = 0.3        # 每个词带行内格式（加粗、斜体等）的概率
+DEFAULT_REPEAT = 3
+DEFAULT_SEED = 20251031
+
+# 阶段名称（按执行顺序）
+STAGES = ('read', 'parse', 'build', 'save')
+
+# ==================== 合成语料 ====================
+# 公文常用词汇，组合成正文句子
+CORPUS_WORDS = (
+    '深入贯彻', '全面落实', '统筹推进', '高质量发展', '体制机制', '重点任务', '工作要求',
+    '组织领导', '责任分工', '督促检查', '政策措施', '基层治理', '营商环境', '数字政府',
+    '安全生产', '民生保障', '财政资金', '绩效评价', '风险防控', '协同联动', '试点示范',
+)
+CHINESE_NUMBERS = '一二三四五六七八九十'
+
+# 行内格式标记
+INLINE_MARKS = (('**', '**'), ('*', '*'), ('~~', '~~'), ('`', '`'))
+
+
+def _sentence(rng, inline_density, words=12):
+    """生成一句正文，按概率给词语加上行内格式标记"""
+    parts = []
+    for _ in range(words):
+        word = rng.choice(CORPUS_WORDS)
+        if rng.random() < inline_density:
+            start, end = rng.choice(INLINE_MARKS)
+            word = f"{start}{word}{end}"
+        parts.append(word)
+    return '，'.join(parts) + '。'
+
+
+def _table(rng, rows, cols, inline_density):
+    """生成一张Markdown表格（含表头和分隔行）"""
+    header = ['序号'] + [f"指标{j}" for j in range(1, cols)]
+    lines = ['| ' + ' | '.join(header) + ' |', '|' + '---|' * cols]
+    for i in range(1, rows + 1):
+        cells = [str(i)]
+        for _ in range(1, cols):
+            cell = f"{rng.uniform(0, 10000):.2f}"
+            if rng.random() < inline_density:
+                cell = f"**{cell}**"
+            cells.append(cell)
+        lines.append('| ' + ' | '.join(cells) + ' |')
+    return lines
+
+
+def generate_gov_markdown(blocks, heading_density=DEFAULT_HEADING_DENSITY, list_ratio=DEFAULT_LIST_RATIO,
+                          table_every=DEFAULT_TABLE_EVERY, table_rows=DEFAULT_TABLE_ROWS,
+                          table_cols=DEFAULT_TABLE_COLS, inline_density=DEFAULT_INLINE_DENSITY,
+                          seed=DEFAULT_SEED):
+    """
+    生成合成的公文风格Markdown文本（相同参数和种子生成的内容完全相同）
+
+    参数:
+        blocks: 块数（标题、列表项、正文段落、表格各算一块，不含主标题）
+        heading_density: 标题块占比，级别在一级、二级、三级标题中随机选取
+        list_ratio: 列表项占比
+        table_every: 每多少个块插入一张表格，0表示不插入表格
+        table_rows: 表格数据行数
+        table_cols: 表格列数
+        inline_density: 每个词带行内格式的概率
+        seed: 随机种子
+
+    返回:
+        Markdown文本
+    """
+    rng = random.Random(seed)
+    lines = ['# 关于进一步做好重点工作的通知', '']
+    counters = [0, 0, 0]  # 一级、二级、三级标题序号
+
+    for index in range(1, blocks + 1):
+        if table_every and index % table_every == 0:
+            lines.extend(_table(rng, table_rows, table_cols, inline_density))
+            lines.append('')
+            continue
+
+        roll = rng.random()
+        if roll < heading_density:
+            level = rng.randrange(3)
+            counters[level] += 1
+            number = counters[level]
+            title = rng.choice(CORPUS_WORDS) + rng.choice(CORPUS_WORDS)
+            if level == 0:
+                lines.append(f"## {CHINESE_NUMBERS[(number - 1) % 10]}、{title}")
+            elif level == 1:
+                lines.append(f"### （{CHINESE_NUMBERS[(number - 1) % 10]}）{title}")
+            else:
+                lines.append(f"#### {number}. {title}")
+        elif roll < heading_density + list_ratio:
+            lines.append('- ' + _sentence(rng, inline_density, words=6))
+        else:
+            lines.append(_sentence(rng, inline_density))
+        lines.append('')
+
+    return '\n'.join(lines) + '\n'
+
+
+def scale_markdown(text, copies):
+    """
+    把一份真实文档（如example.md）放大为更长的语料：主标题保留一个，其余内容重复copies次
+
+    参数:
+        text: Markdown文本
+        copies: 重复次数
+
+    返回:
+        Markdown文本
+    """
+    lines = text.splitlines()
+    title = []
+    for index, line in enumerate(lines):
+        if line.strip():
+            if line.startswith('# '):
+                title, lines = [line, ''], lines[index + 1:]
+            break
+    body = '\n'.join(lines).strip('\n')
+    return '\n'.join(title + [body] * copies) + '\n'
+
+
+# ==================== 分阶段计时 ====================
+def _peak_rss_kb():
+    """当前进程的峰值常驻内存（KB），不支持时返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS的单位是字节，Linux是KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_stages(md_path, use_styles=False):
+    """
+    对一个Markdown文件执行一次完整转换，分别计时各阶段
+
+    参数:
+        md_path: Markdown文件路径
+        use_styles: 是否使用公文命名样式代替直接格式
+
+    返回:
+        dict：各阶段耗时（秒）、块数、输出字节数
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    with open(md_path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    timings['read'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    blocks = list(tokenize_markdown(lines))
+    timings['parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    doc = new_gov_document()
+    for kind, content in blocks:
+        add_block_to_doc(doc, kind, content, use_styles)
+    timings['build'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    timings['save'] = time.perf_counter() - start
+
+    return {'timings': timings, 'blocks': len(blocks), 'output_bytes': buffer.tell()}
+
+
+def time_inline_parsing(md_path, repeat):
+    """
+    单独测量行内格式解析（parse_inline_format）的耗时
+
+    返回:
+        dict：参与解析的文本数、最短耗时（秒）
+    """
+    with open(md_path, 'r', encoding='utf-8') as f:
+        texts = [content for kind, content in tokenize_markdown(f)
+                 if kind in (BLOCK_PARAGRAPH, BLOCK_LIST_ITEM)]
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            parse_inline_format(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'texts': len(texts), 'seconds': best}
+
+
+def time_body_paragraphs(md_path, repeat, use_styles=False):
+    """
+    对比正文和列表项段落的两种写入方式：
+    当前路径（纯文本段落走快速路径）与完整路径（每段都做序号空格处理和行内格式解析）
+
+    返回:
+        dict：段落数、纯文本段落数、两种方式的最短耗时（秒）
+    """
+    with open(md_path, 'r', encoding='utf-8') as f:
+        blocks = [(kind, content) for kind, content in tokenize_markdown(f)
+                  if kind in (BLOCK_PARAGRAPH, BLOCK_LIST_ITEM)]
+
+    def fast(doc, kind, content):
+        add_block_to_doc(doc, kind, content, use_styles)
+
+    def full(doc, kind, content):
+        add_block_text(doc.add_paragraph(), content, BLOCK_PARAGRAPH, use_styles)
+
+    best = {}
+    for name, write in (('fast_path_seconds', fast), ('full_path_seconds', full)):
+        for _ in range(repeat):
+            doc = new_gov_document()
+            start = time.perf_counter()
+            for kind, content in blocks:
+                write(doc, kind, content)
+            elapsed = time.perf_counter() - start
+            best[name] = min(best.get(name, elapsed), elapsed)
+
+    return dict(best, paragraphs=len(blocks),
+                plain=sum(1 for _, content in blocks if is_plain_text(content)))
+
+
+def benchmark_case(md_path, repeat=DEFAULT_REPEAT, use_styles=False):
+    """
+    重复转换同一文件，各阶段取中位数（在独立子进程中执行，峰值内存互不影响）
+
+    返回:
+        dict：各阶段中位耗时、总耗时、块数、输出字节数、峰值内存、行内解析耗时、正文段落写入耗时
+    """
+    baseline_rss = _peak_rss_kb()
+    runs = [run_stages(md_path, use_styles) for _ in range(repeat)]
+    peak_rss = _peak_rss_kb()
+
+    stages = {stage: statistics.median(run['timings'][stage] for run in runs) for stage in STAGES}
+    return {
+        'stages': stages,
+        'total': sum(stages.values()),
+        'blocks': runs[0]['blocks'],
+        'output_bytes': runs[0]['output_bytes'],
+        'peak_rss_kb': peak_rss,
+        'peak_rss_delta_kb': peak_rss - baseline_rss if peak_rss is not None else None,
+        'inline': time_inline_parsing(md_path, repeat),
+        'body': time_body_paragraphs(md_path, repeat, use_styles),
+    }
+
+
+# ==================== 基准测试入口 ====================
+def run_benchmarks(sizes, corpus_options, repeat=DEFAULT_REPEAT, use_styles=False, work_dir=None,
+                   source_text=None):
+    """
+    按各规模生成语料并测量
+
+    参数:
+        sizes: 语料规模列表（块数；指定source_text时为重复次数）
+        corpus_options: 传给generate_gov_markdown的语料参数（不含blocks）
+        repeat: 每个规模的重复次数
+        use_styles: 是否使用公文命名样式代替直接格式
+        work_dir: 语料文件存放目录，None时使用临时目录
+        source_text: 真实文档的Markdown文本，指定时用scale_markdown放大该文档代替合成语料
+
+    返回:
+        可直接序列化为JSON的结果字典
+    """
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'python_docx': getattr(docx, '__version__', None),
+            'platform': platform.platform(),
+            'output_format_version': OUTPUT_FORMAT_VERSION,
+        },
+        'options': dict(corpus_options, repeat=repeat, use_styles=use_styles,
+                        source=source_text is not None),
+        'cases': [],
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = Path(work_dir or tmp_dir)
+        corpus_dir.mkdir(parents=True, exist_ok=True)
+
+        for size in sizes:
+            md_path = corpus_dir / f"bench_{size}.md"
+            if source_text is not None:
+                text = scale_markdown(source_text, size)
+            else:
+                text = generate_gov_markdown(size, **corpus_options)
+            md_path.write_text(text, encoding='utf-8')
+
+            # 每个规模使用全新的子进程，峰值内存只反映本次转换
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                case = pool.submit(benchmark_case, str(md_path), repeat, use_styles).result()
+
+            case['size'] = size
+            case['unit'] = '份' if source_text is not None else '块'
+            case['input_bytes'] = md_path.stat().st_size
+            results['cases'].append(case)
+            print_case(case)
+
+    return results
+
+
+def print_case(case):
+    """输出单个规模的测量结果（写到标准错误，标准输出只留给JSON结果）"""
+    stages = '  '.join(f"{stage}={case['stages'][stage] * 1000:.1f}ms" for stage in STAGES)
+    rss = case['peak_rss_kb']
+    body = case['body']
+    print(f"✅ {case['size']:>7}{case['unit']} {case['input_bytes'] / 1024:>9.1f}KB  "
+          f"合计={case['total'] * 1000:.1f}ms  {stages}  "
+          f"行内解析={case['inline']['seconds'] * 1000:.1f}ms  "
+          f"峰值内存={'%.1fMB' % (rss / 1024) if rss is not None else '未知'}", file=sys.stderr)
+    print(f"   正文段落{body['paragraphs']}个（纯文本{body['plain']}个）  "
+          f"快速路径={body['fast_path_seconds'] * 1000:.1f}ms  "
+          f"完整路径={body['full_path_seconds'] * 1000:.1f}ms", file=sys.stderr)
+
+
+def build_arg_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(
+        prog=Path(__file__).name,
+        description='Markdown转公文格式的性能基准测试'
+    )
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='语料规模（块数），逗号分隔，默认%(default)s')
+    parser.add_argument('--heading-density', type=float, default=DEFAULT_HEADING_DENSITY,
+                        help='标题块占比，默认%(default)s')
+    parser.add_argument('--list-ratio', type=float, default=DEFAULT_LIST_RATIO,
+                        help='列表项占比，默认%(default)s')
+    parser.add_argument('--table-every', type=int, default=DEFAULT_TABLE_EVERY,
+                        help='每多少个块插入一张表格，0表示不插入，默认%(default)s')
+    parser.add_argument('--table-rows', type=int, default=DEFAULT_TABLE_ROWS,
+                        help='表格数据行数，默认%(default)s')
+    parser.add_argument('--table-cols', type=int, default=DEFAULT_TABLE_COLS,
+                        help='表格列数，默认%(default)s')
+    parser.add_argument('--inline-density', type=float, default=DEFAULT_INLINE_DENSITY,
+                        help='每个词带行内格式的概率，默认%(default)s')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='随机种子')
+    parser.add_argument('--source', metavar='FILE',
+                        help='以该Markdown文档（如example.md）重复放大作为语料，此时--sizes为重复次数')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='每个规模的重复次数（各阶段取中位数），默认%(default)s')
+    parser.add_argument('--styles', action='store_true', help='使用公文命名样式代替直接格式')
+    parser.add_argument('--output', metavar='FILE', help='结果JSON文件路径，默认输出到标准输出')
+    parser.add_argument('--corpus-dir', metavar='DIR', help='保留生成的语料文件到该目录')
+    parser.add_argument('--generate', metavar='FILE',
+                        help='只生成一份语料（取--sizes的第一个规模）写入该文件，不做测量')
+    return parser
+
+
+def main():
+    """命令行主函数"""
+    args = build_arg_parser().parse_args()
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    corpus_options = {
+        'heading_density': args.heading_density,
+        'list_ratio': args.list_ratio,
+        'table_every': args.table_every,
+        'table_rows': args.table_rows,
+        'table_cols': args.table_cols,
+        'inline_density': args.inline_density,
+        'seed': args.seed,
+    }
+
+    source_text = Path(args.source).read_text(encoding='utf-8') if args.source else None
+
+    if args.generate:
+        if source_text is not None:
+            text = scale_markdown(source_text, sizes[0])
+        else:
+            text = generate_gov_markdown(sizes[0], **corpus_options)
+        Path(args.generate).write_text(text, encoding='utf-8')
+        print(f"✅ 已生成语料: {args.generate}")
+        return
+
+    results = run_benchmarks(sizes, corpus_options, args.repeat, args.styles, args.corpus_dir, source_text)
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+        print(f"✅ 结果已写入: {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
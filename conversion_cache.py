@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown转政府公文格式 - 转换结果缓存
+按输入内容哈希缓存生成的docx字节，相同内容重复提交时直接返回；
+批量转换另有按文件路径、修改时间、大小和内容哈希记录的持久缓存，重新运行时跳过未改动的文件
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from md2gov_docx import OUTPUT_FORMAT_VERSION, convert_markdown_string
+
+# 默认容量
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024     # 内存层：64MB
+DEFAULT_DISK_BYTES = 512 * 1024 * 1024      # 磁盘层：512MB
+
+# 磁盘缓存文件后缀
+CACHE_FILE_SUFFIX = '.docx'
+
+# 批量缓存：文件索引的文件名、输出文件的存放目录、计算内容哈希时每次读取的字节数
+BATCH_INDEX_FILE = 'files.json'
+BATCH_OUTPUT_DIR = 'outputs'
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def make_cache_key(text, use_styles=False):
+    """
+    计算转换缓存键
+    键由输出格式版本、转换选项和Markdown文本共同决定，
+    排版逻辑变化（OUTPUT_FORMAT_VERSION递增）后旧缓存自动失效
+    """
+    digest = hashlib.sha256()
+    digest.update(f"v{OUTPUT_FORMAT_VERSION}:styles={int(use_styles)}\n".encode('utf-8'))
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """
+    两级转换结果缓存
+
+    - 内存层：按总字节数限制容量的LRU
+    - 磁盘层（可选）：按总字节数限制容量，按文件修改时间淘汰最久未使用的条目
+
+    线程安全，可在Flask多线程环境和Streamlit多会话之间共享。
+    """
+
+    def __init__(self, max_memory_bytes=DEFAULT_MEMORY_BYTES, disk_dir=None,
+                 max_disk_bytes=DEFAULT_DISK_BYTES):
+        """
+        参数:
+            max_memory_bytes: 内存层容量（字节），0表示不使用内存层
+            disk_dir: 磁盘层目录，None表示不使用磁盘层
+            max_disk_bytes: 磁盘层容量（字节）
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()    # 键 -> docx字节，按最近使用排序
+        self._memory_bytes = 0
+        self._disk_index = OrderedDict()  # 键 -> 文件大小，按最近使用排序
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._load_disk_index()
+
+    # ---------- 对外接口 ----------
+    def get_or_convert(self, text, use_styles=False, stats=None, converter=None):
+        """
+        返回Markdown文本对应的docx字节，缓存未命中时转换并写入缓存
+
+        参数:
+            text: Markdown文本内容
+            use_styles: 是否使用公文命名样式代替直接格式
+            stats: ConversionStats，可选，只在实际发生转换（未命中缓存）时填充
+            converter: 转换函数converter(text, use_styles, stats)，默认在当前进程中转换，
+                       可换成ConversionWorkerPool.convert交给常驻进程池
+        """
+        key = make_cache_key(text, use_styles)
+        data = self.get(key)
+        if data is None:
+            data = (converter or convert_markdown_string)(text, use_styles, stats)
+            self.put(key, data)
+        return data
+
+    def get(self, key):
+        """按缓存键读取docx字节，未命中返回None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return data
+
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._put_memory(key, data)
+        return data
+
+    def put(self, key, data):
+        """写入缓存（内存层和磁盘层）"""
+        with self._lock:
+            self._put_memory(key, data)
+        self._write_disk(key, data)
+
+    def clear(self):
+        """清空内存层并删除磁盘层的所有缓存文件"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            keys = list(self._disk_index)
+            self._disk_index.clear()
+            self._disk_bytes = 0
+        for key in keys:
+            self._remove_disk_file(key)
+
+    def stats(self):
+        """返回缓存命中统计和容量占用"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'memory_items': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_enabled': self.disk_dir is not None,
+                'disk_items': len(self._disk_index),
+                'disk_bytes': self._disk_bytes,
+            }
+
+    # ---------- 内存层 ----------
+    def _put_memory(self, key, data):
+        """写入内存层并按容量淘汰（调用方需持有锁）"""
+        size = len(data)
+        if size > self.max_memory_bytes:
+            return
+
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += size
+
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # ---------- 磁盘层 ----------
+    def _disk_path(self, key):
+        """缓存文件路径：按键的前两位分目录，避免单目录文件过多"""
+        return self.disk_dir / key[:2] / (key + CACHE_FILE_SUFFIX)
+
+    def _load_disk_index(self):
+        """启动时扫描磁盘层，按修改时间恢复LRU顺序"""
+        entries = []
+        for path in self.disk_dir.glob('*/*' + CACHE_FILE_SUFFIX):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _read_disk(self, key):
+        """从磁盘层读取，文件被其他进程删除时视为未命中"""
+        if self.disk_dir is None:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # 更新修改时间，作为最近使用时间
+        except OSError:
+            with self._lock:
+                size = self._disk_index.pop(key, None)
+                if size is not None:
+                    self._disk_bytes -= size
+            return None
+
+        with self._lock:
+            if key not in self._disk_index:
+                self._disk_bytes += len(data)
+            self._disk_index[key] = len(data)
+            self._disk_index.move_to_end(key)
+        return data
+
+    def _write_disk(self, key, data):
+        """写入磁盘层：先写临时文件再原子替换，避免读到半个文件"""
+        if self.disk_dir is None or len(data) > self.max_disk_bytes:
+            return
+
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        with self._lock:
+            old = self._disk_index.pop(key, None)
+            if old is not None:
+                self._disk_bytes -= old
+            self._disk_index[key] = len(data)
+            self._disk_bytes += len(data)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        """按容量淘汰磁盘层中最久未使用的条目"""
+        evicted = []
+        with self._lock:
+            while self._disk_bytes > self.max_disk_bytes and self._disk_index:
+                key, size = self._disk_index.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(key)
+        for key in evicted:
+            self._remove_disk_file(key)
+
+    def _remove_disk_file(self, key):
+        try:
+            self._disk_path(key).unlink()
+        except OSError:
+            pass
+
+
+def file_digest(path):
+    """文件内容的SHA-256（分块读取）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BatchCache:
+    """
+    批量转换的持久缓存
+
+    - 文件索引：输入文件的绝对路径 -> 修改时间、大小、内容哈希、转换选项、输出格式版本及输出文件的状态。
+      输入的修改时间和大小未变时不读取文件；输出文件也未变时整个文件直接跳过
+    - 输出内容：按内容哈希、转换选项和输出格式存放在ConversionCache的磁盘层，
+      总容量受限，按最近使用淘汰。输入内容相同（如只是修改时间变了、文件被移动）时直接写出缓存的结果
+
+    索引只在save()时写回磁盘，供单个批量任务在主进程中使用。
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_DISK_BYTES, rebuild=False):
+        """
+        参数:
+            cache_dir: 缓存目录
+            max_bytes: 输出内容的总容量（字节）
+            rebuild: True时丢弃已有的索引和输出内容，本次全部重新转换并写入缓存
+        """
+        self.cache_dir = Path(cache_dir)
+        self.store = ConversionCache(max_memory_bytes=0, disk_dir=self.cache_dir / BATCH_OUTPUT_DIR,
+                                     max_disk_bytes=max_bytes)
+        self._index_path = self.cache_dir / BATCH_INDEX_FILE
+        self._files = {}
+        self._pending = {}  # 未命中的输入路径 -> (查找时的状态, 内容哈希)
+
+        self.skipped = 0
+        self.restored = 0
+        self.misses = 0
+
+        if rebuild:
+            self.store.clear()
+        else:
+            self._load_index()
+
+    # ---------- 对外接口 ----------
+    def restore(self, md_path, outputs, use_styles=False):
+        """
+        检查输入文件是否可以不经转换得到输出：输出未变化时跳过，否则从缓存写出
+
+        参数:
+            md_path: 输入文件路径
+            outputs: {输出格式: 输出路径}，如{'docx': 'a.docx', 'pdf': 'a.pdf'}
+            use_styles: 是否使用公文命名样式
+
+        返回:
+            命中时返回输入文件的字节数，未命中（需要转换）返回None
+        """
+        path = os.path.abspath(md_path)
+        try:
+            stat = os.stat(path)
+            entry = self._files.get(path)
+            if entry is not None and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                digest = entry['digest']
+                # 输出格式版本变化（排版逻辑更新）后，已有的输出文件也要重新生成
+                if (entry.get('version') == OUTPUT_FORMAT_VERSION and entry['styles'] == use_styles
+                        and entry['outputs'] == _output_states(outputs)):
+                    self.skipped += 1
+                    return stat.st_size
+            else:
+                digest = file_digest(path)
+
+            contents = {}
+            for fmt in outputs:
+                data = self.store.get(_output_key(digest, use_styles, fmt))
+                if data is None:
+                    break
+                contents[fmt] = data
+            else:
+                for fmt, data in contents.items():
+                    _write_output(outputs[fmt], data)
+                self._record(path, stat, digest, use_styles, outputs)
+                self.restored += 1
+                return stat.st_size
+        except OSError:
+            return None
+
+        self._pending[path] = (stat, digest)
+        self.misses += 1
+        return None
+
+    def store_outputs(self, md_path, outputs, use_styles=False):
+        """
+        转换成功后把输出文件存入缓存并更新索引
+        转换期间输入文件被修改时不记录，下次仍会重新转换
+        """
+        path = os.path.abspath(md_path)
+        stat, digest = self._pending.pop(path, (None, None))
+        try:
+            current = os.stat(path)
+            if stat is None or (current.st_mtime_ns, current.st_size) != (stat.st_mtime_ns, stat.st_size):
+                return
+            for fmt, output_path in outputs.items():
+                self.store.put(_output_key(digest, use_styles, fmt), Path(output_path).read_bytes())
+            self._record(path, stat, digest, use_styles, outputs)
+        except OSError:
+            pass
+
+    def save(self):
+        """写回文件索引（先写临时文件再原子替换），输入文件已不存在的条目一并清除"""
+        files = {path: entry for path, entry in self._files.items() if os.path.exists(path)}
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(files, f, ensure_ascii=False)
+            os.replace(tmp_path, self._index_path)
+        except OSError:
+            pass
+
+    # ---------- 文件索引 ----------
+    def _load_index(self):
+        """读取文件索引，索引损坏时视为空"""
+        try:
+            with open(self._index_path, encoding='utf-8') as f:
+                files = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(files, dict):
+            self._files = files
+
+    def _record(self, path, stat, digest, use_styles, outputs):
+        self._files[path] = {
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'digest': digest,
+            'styles': use_styles,
+            'version': OUTPUT_FORMAT_VERSION,
+            'outputs': _output_states(outputs),
+        }
+
+
+def _output_key(digest, use_styles, fmt):
+    """批量缓存中输出内容的键：输出格式版本、转换选项、输出格式和输入内容哈希"""
+    return hashlib.sha256(f"v{OUTPUT_FORMAT_VERSION}:styles={int(use_styles)}:{fmt}\n{digest}".encode('utf-8')).hexdigest()
+
+
+def _output_states(outputs):
+    """输出文件的状态 {输出格式: [绝对路径, 修改时间, 大小]}，任一文件不存在时返回None"""
+    states = {}
+    for fmt, output_path in outputs.items():
+        try:
+            stat = os.stat(output_path)
+        except OSError:
+            return None
+        states[fmt] = [os.path.abspath(output_path), stat.st_mtime_ns, stat.st_size]
+    return states
+
+
+def _write_output(output_path, data):
+    """写出缓存的输出文件"""
+    path = Path(output_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
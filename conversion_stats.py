@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown转政府公文格式 - 转换性能统计
+记录单次转换各阶段的耗时和块、Run、表格、输出字节等计数，
+并在进程内累计，导出为Prometheus文本格式的指标
+"""
+
+import threading
+import time
+
+# 转换阶段
+STAGE_TOKENIZE = 'tokenize'     # 块级分词（行分类、表格识别）
+STAGE_HEADING = 'heading'       # 标题段落写入
+STAGE_PARAGRAPH = 'paragraph'   # 正文、列表项写入（含行内格式解析）
+STAGE_TABLE = 'table'           # 表格构建
+STAGE_SAVE = 'save'             # 序列化并写出docx
+STAGES = (STAGE_TOKENIZE, STAGE_HEADING, STAGE_PARAGRAPH, STAGE_TABLE, STAGE_SAVE)
+
+# 计数项及说明
+COUNTER_DESCRIPTIONS = {
+    'blocks': '块数',
+    'headings': '标题段落数',
+    'paragraphs': '正文和列表项段落数',
+    'runs': 'Run数（含表格单元格）',
+    'tables': '表格数',
+    'table_cells': '表格单元格数',
+    'output_bytes': '输出docx字节数',
+}
+COUNTERS = tuple(COUNTER_DESCRIPTIONS)
+
+# Prometheus指标名前缀
+METRICS_PREFIX = 'md2gov'
+
+
+class ConversionStats:
+    """
+    单次转换的统计信息
+
+    同一阶段可多次进入（例如每个表格计一次表格阶段），耗时累加。
+    on_stage_start(阶段名)、on_stage_end(阶段名, 本次耗时秒数)为可选回调，
+    可用于记录日志、上报链路追踪，或定位单个特别慢的表格。
+    """
+
+    def __init__(self, on_stage_start=None, on_stage_end=None):
+        self.on_stage_start = on_stage_start
+        self.on_stage_end = on_stage_end
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.started_at = None
+        self.elapsed = None
+
+    def start_stage(self, stage):
+        """进入阶段，返回开始时间，交给end_stage"""
+        if self.on_stage_start is not None:
+            self.on_stage_start(stage)
+        started = time.perf_counter()
+        if self.started_at is None:
+            self.started_at = started
+        return started
+
+    def end_stage(self, stage, started):
+        """结束阶段，累计耗时"""
+        seconds = time.perf_counter() - started
+        self.stage_seconds[stage] += seconds
+        if self.on_stage_end is not None:
+            self.on_stage_end(stage, seconds)
+
+    def count(self, name, value=1):
+        """累加计数项"""
+        self.counters[name] += value
+
+    def finish(self, output_bytes=None):
+        """转换结束：记录总耗时和输出字节数"""
+        if output_bytes is not None:
+            self.counters['output_bytes'] = output_bytes
+        if self.started_at is not None:
+            self.elapsed = time.perf_counter() - self.started_at
+
+    @property
+    def finished(self):
+        """是否已完成一次转换（命中缓存时不会产生转换）"""
+        return self.elapsed is not None
+
+    def to_dict(self):
+        """统计结果，用于JSON输出"""
+        return {
+            'elapsed': self.elapsed,
+            'stages': dict(self.stage_seconds),
+            'counters': dict(self.counters),
+        }
+
+    def load(self, data):
+        """从to_dict()的结果恢复统计（例如由转换进程传回的统计）"""
+        self.elapsed = data['elapsed']
+        self.stage_seconds.update(data['stages'])
+        self.counters.update(data['counters'])
+
+    def summary(self):
+        """多行文本摘要，用于命令行输出"""
+        lines = [f"   总耗时: {(self.elapsed or 0) * 1000:.1f}ms"]
+        for stage in STAGES:
+            lines.append(f"   {stage:<10} {self.stage_seconds[stage] * 1000:>10.1f}ms")
+        counters = '  '.join(f"{name}={value}" for name, value in self.counters.items())
+        lines.append(f"   {counters}")
+        return '\n'.join(lines)
+
+
+# ==================== Prometheus指标 ====================
+def format_metric(name, metric_type, help_text, samples):
+    """
+    按Prometheus文本格式输出一个指标
+
+    参数:
+        name: 指标名
+        metric_type: counter 或 gauge
+        help_text: 指标说明
+        samples: [(标签dict或None, 值), ...]
+
+    返回:
+        文本（以换行结尾）
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        if labels:
+            label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+        else:
+            lines.append(f"{name} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+class ConversionMetrics:
+    """
+    进程内累计的转换指标，线程安全
+
+    每次转换完成后调用observe(stats)，render()输出Prometheus文本格式
+    """
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.conversions = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def observe(self, stats):
+        """累计一次已完成转换的统计"""
+        with self._lock:
+            self.conversions += 1
+            self.seconds += stats.elapsed or 0.0
+            for stage, seconds in stats.stage_seconds.items():
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+            for name, value in stats.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe_failure(self):
+        """记录一次失败的转换"""
+        with self._lock:
+            self.failures += 1
+
+    def render(self):
+        """输出Prometheus文本格式的指标"""
+        prefix = self.prefix
+        with self._lock:
+            parts = [
+                format_metric(f"{prefix}_conversions_total", 'counter', '完成的转换次数',
+                              [(None, self.conversions)]),
+                format_metric(f"{prefix}_conversion_failures_total", 'counter', '失败的转换次数',
+                              [(None, self.failures)]),
+                format_metric(f"{prefix}_conversion_seconds_total", 'counter', '转换总耗时（秒）',
+                              [(None, self.seconds)]),
+                format_metric(f"{prefix}_stage_seconds_total", 'counter', '各阶段累计耗时（秒）',
+                              [({'stage': stage}, seconds) for stage, seconds in self.stage_seconds.items()]),
+            ]
+            for name, value in self.counters.items():
+                parts.append(format_metric(f"{prefix}_{name}_total", 'counter',
+                                           '累计' + COUNTER_DESCRIPTIONS.get(name, name), [(None, value)]))
+        return ''.join(parts)
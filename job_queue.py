@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown转政府公文格式 - 异步转换任务队列
+大文档转换放到后台工作线程执行，Web请求只负责提交任务和查询状态
+"""
+
+import io
+import queue
+import threading
+import time
+import uuid
+
+from conversion_cache import make_cache_key
+from conversion_stats import ConversionStats
+from md2gov_docx import build_gov_document, iter_markdown_lines, save_gov_document
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# 默认配置
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 32
+DEFAULT_RESULT_TTL = 600    # 已结束任务的保留时间（秒）
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+
+class ConversionJob:
+    """单个转换任务的状态"""
+
+    def __init__(self, text, use_styles=False):
+        self.id = uuid.uuid4().hex
+        self.text = text
+        self.use_styles = use_styles
+        self.status = JOB_QUEUED
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.stats = None
+
+    def to_dict(self):
+        """任务状态（不含结果内容），用于JSON响应"""
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': round(self.progress, 3),
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'result_size': len(self.result) if self.result is not None else None,
+            'stats': self.stats.to_dict() if self.stats is not None else None,
+        }
+
+
+class LocalBroker:
+    """
+    进程内的任务代理，作为外部消息队列（如Redis、RabbitMQ）的本地替身
+    只传递任务ID，容量有限，满时拒绝提交以形成背压
+    """
+
+    def __init__(self, max_size=DEFAULT_QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=max_size)
+
+    def publish(self, job_id):
+        """提交任务ID，队列已满时抛出QueueFullError"""
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            raise QueueFullError('任务队列已满')
+
+    def consume(self):
+        """阻塞等待下一个任务ID"""
+        return self._queue.get()
+
+    def pending(self):
+        """队列中等待的任务数"""
+        return self._queue.qsize()
+
+
+class JobQueue:
+    """
+    有界的后台转换任务队列
+
+    - 固定数量的工作线程从代理中取任务执行
+    - 队列已满时submit抛出QueueFullError，由调用方返回429
+    - 已结束的任务在result_ttl秒后清理，避免结果长期占用内存
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_queue=DEFAULT_QUEUE_SIZE,
+                 result_ttl=DEFAULT_RESULT_TTL, cache=None, broker=None, metrics=None, converter=None):
+        """
+        参数:
+            workers: 工作线程数
+            max_queue: 等待队列容量
+            result_ttl: 已结束任务的保留时间（秒）
+            cache: 可选的ConversionCache，命中时直接完成任务，转换结果也会写入缓存
+            broker: 任务代理，默认使用LocalBroker
+            metrics: 可选的ConversionMetrics，累计每次实际转换的统计
+            converter: 可选的转换函数converter(text, use_styles, stats)，例如ConversionWorkerPool.convert；
+                       设置后转换交给该函数执行，进度只在完成时更新
+        """
+        self.result_ttl = result_ttl
+        self.cache = cache
+        self.broker = broker or LocalBroker(max_queue)
+        self.metrics = metrics
+        self.converter = converter
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker_loop, name=f'md2gov-job-{index}', daemon=True)
+            thread.start()
+
+    # ---------- 对外接口 ----------
+    def submit(self, text, use_styles=False):
+        """提交转换任务，返回ConversionJob；队列已满时抛出QueueFullError"""
+        self._expire_finished()
+
+        job = ConversionJob(text, use_styles)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self.broker.publish(job.id)
+        except QueueFullError:
+            with self._lock:
+                del self._jobs[job.id]
+            raise
+        return job
+
+    def get(self, job_id):
+        """按ID查询任务，不存在（或已过期清理）时返回None"""
+        self._expire_finished()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        """返回各状态的任务数"""
+        with self._lock:
+            counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        counts['pending'] = self.broker.pending()
+        return counts
+
+    # ---------- 工作线程 ----------
+    def _worker_loop(self):
+        while True:
+            job_id = self.broker.consume()
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is not None:
+                self._run(job)
+
+    def _run(self, job):
+        """执行单个任务，异常记录在任务上，不影响工作线程"""
+        job.status = JOB_RUNNING
+
+        def report(done, total):
+            job.progress = done / total if total else 1.0
+
+        try:
+            key = make_cache_key(job.text, job.use_styles)
+            data = self.cache.get(key) if self.cache is not None else None
+            if data is None:
+                stats = ConversionStats()
+                if self.converter is not None:
+                    data = self.converter(job.text, job.use_styles, stats)
+                else:
+                    buffer = io.BytesIO()
+                    doc = build_gov_document(iter_markdown_lines(job.text), job.use_styles, report, stats)
+                    save_gov_document(doc, buffer, stats)
+                    data = buffer.getvalue()
+                job.stats = stats
+                if self.metrics is not None:
+                    self.metrics.observe(stats)
+                if self.cache is not None:
+                    self.cache.put(key, data)
+            job.result = data
+            job.progress = 1.0
+            job.status = JOB_DONE
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = JOB_FAILED
+            if self.metrics is not None:
+                self.metrics.observe_failure()
+        finally:
+            job.text = None  # 释放输入文本
+            job.finished_at = time.time()
+
+    def _expire_finished(self):
+        """清理超过保留时间的已结束任务"""
+        deadline = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < deadline]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown转政府公文格式 - 命令行启动层
+只依赖标准库：用法说明、常驻转换进程（--server/--daemon）及其客户端。
+md2gov_docx.py作为命令行运行时先经过这里，用法说明和可交给常驻进程的转换都不再导入python-docx。
+除os、sys外的模块都在用到时才导入，不使用常驻进程的调用几乎没有额外的启动开销
+"""
+
+import os
+import sys
+
+# 命令行入口脚本
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN_SCRIPT = os.path.join(SOURCE_DIR, 'md2gov_docx.py')
+
+# 常驻进程执行转换时可能导入的本项目模块，任一改动都使常驻进程过期
+SOURCE_MODULES = ('md2gov_docx.py', 'md2gov_cli.py', 'md2gov_pdf.py', 'md2gov_preview.py',
+                  'conversion_cache.py', 'conversion_stats.py')
+
+# 表示标准输入/标准输出的路径
+STDIO_PATH = '-'
+
+# 常驻转换进程的套接字路径（环境变量），默认在用户缓存目录下
+SOCKET_ENV = 'MD2GOV_SOCKET'
+SOCKET_NAME = 'daemon.sock'
+DAEMON_LOG_NAME = 'daemon.log'
+DAEMON_START_TIMEOUT = 10   # 等待后台常驻进程就绪的最长时间（秒）
+
+# 这些调用需要完整的命令行处理，不交给常驻进程
+LOCAL_ONLY_OPTIONS = {'--batch', '--watch', '--server', '--no-daemon', '-h', '--help'}
+
+
+def cache_dir():
+    """命令行的缓存目录（公文基础模板、批量转换缓存、常驻进程的套接字和日志）"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'md2gov')
+
+
+def default_socket_path():
+    """常驻转换进程的Unix套接字路径"""
+    return os.environ.get(SOCKET_ENV) or os.path.join(cache_dir(), SOCKET_NAME)
+
+
+def source_version():
+    """转换代码的版本标识（SOURCE_MODULES中各模块的修改时间和大小），常驻进程据此发现自己已过期"""
+    parts = []
+    for name in SOURCE_MODULES:
+        try:
+            stat = os.stat(os.path.join(SOURCE_DIR, name))
+        except OSError:
+            parts.append('-')
+            continue
+        parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+    return ','.join(parts)
+
+
+def print_usage():
+    """输出命令行使用说明"""
+    name = os.path.basename(MAIN_SCRIPT)
+    print("\n" + "="*60)
+    print("Markdown转政府公文格式Word文档工具 v1.0.0")
+    print("="*60)
+    print("\n使用方法:")
+    print(f"  python {name} <输入.md文件> <输出.docx文件> [--styles] [--stream] [--profile] [--pdf]")
+    print(f"  python {name} --batch <输入目录> <输出目录> [--jobs N] [--styles] [--pdf] [--no-cache | --rebuild-cache]")
+    print(f"  python {name} <输入.md文件> <输出.docx文件> --watch [--poll] [--debounce 秒]")
+    print(f"  python {name} --daemon | --server | --stop-server [--socket 路径]")
+    print("\n示例:")
+    print(f"  python {name} report.md report_formatted.docx")
+    print(f"  python {name} --batch reports/ formatted/ --jobs 8")
+    print(f"  cat report.md | python {name} - - > report.docx")
+    print(f"  python {name} --batch drafts/ formatted/ --watch")
+    print("\n选项:")
+    print("  --styles        使用公文命名样式（公文正文、一级标题等），文件更小、生成更快")
+    print("  --stream        逐块流式写出，超大文档内存占用恒定")
+    print("  --profile       输出各阶段耗时和块、Run、表格计数")
+    print("  --batch         批量转换目录下所有.md文件，保持目录结构")
+    print("  --jobs N        批量模式的并行进程数（默认为CPU核数）")
+    print("  --pdf           同时在输出文件旁生成同名PDF（需要reportlab，与Word版共用一次解析）")
+    print("  --watch         监视输入文件或目录，保存后自动重新转换（安装watchdog时使用文件事件）")
+    print("  --poll          监视模式改为定时检查文件状态")
+    print("  --debounce 秒   监视模式在最后一次变化后等待多久再转换（默认0.3秒）")
+    print("  --no-cache      批量模式不使用持久缓存（默认跳过上次转换后未改动的文件）")
+    print("  --rebuild-cache 批量模式清空持久缓存后全部重新转换")
+    print("  --cache-size MB 批量模式持久缓存的容量上限（默认512MB）")
+    print("  -               用作输入/输出路径时表示标准输入/标准输出（自动流式处理）")
+    print("  --daemon        在后台启动常驻转换进程，之后的单文件转换自动交给它执行")
+    print("  --server        在前台运行常驻转换进程（供systemd等进程管理工具使用）")
+    print("  --stop-server   停止常驻转换进程")
+    print(f"  --socket 路径   常驻转换进程的套接字（默认取环境变量{SOCKET_ENV}或{default_socket_path()}）")
+    print("  --no-daemon     不使用常驻转换进程，在当前进程中转换")
+    print("\n支持的Markdown语法:")
+    print("  # 主标题        -> 方正小标宋简体 22磅 加粗 居中")
+    print("  ## 一级标题     -> 黑体 16磅")
+    print("  ### 二级标题    -> 楷体_GB2312 16磅 加粗")
+    print("  #### 三级标题   -> 楷体_GB2312 16磅")
+    print("  - 列表项        -> 仿宋_GB2312 16磅")
+    print("  正文            -> 仿宋_GB2312 16磅")
+    print("  **加粗**        -> 加粗")
+    print("  *斜体*          -> 斜体")
+    print("  ~~删除线~~      -> 删除线")
+    print("  `代码`          -> 去除标记，按正文输出")
+    print("\n注意事项:")
+    print("  - 请确保系统已安装所需字体（仿宋_GB2312、楷体_GB2312等）")
+    print("  - macOS用户可在'字体册'中检查字体")
+    print("="*60 + "\n")
+
+
+# ==================== 通信协议 ====================
+# 每个连接一问一答：客户端发送一个JSON对象后关闭写端，服务端回复一个JSON对象后关闭连接
+def _send_json(conn, message):
+    import json
+    conn.sendall(json.dumps(message, ensure_ascii=False).encode('utf-8'))
+
+
+def _recv_json(conn):
+    import json
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+
+def _request(socket_path, message):
+    """向常驻转换进程发送一个请求并等待回复，连接失败时抛出OSError"""
+    import socket
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        _send_json(conn, message)
+        conn.shutdown(socket.SHUT_WR)
+        return _recv_json(conn)
+
+
+def _ping(socket_path):
+    """常驻转换进程是否在运行，返回其进程号或None"""
+    try:
+        return _request(socket_path, {'command': 'ping'}).get('pid')
+    except (OSError, ValueError):
+        return None
+
+
+# ==================== 常驻转换进程 ====================
+def _run_request(request, handler):
+    """
+    在常驻进程中执行一次命令行调用，捕获其输出
+    请求逐个串行处理，可以安全地切换工作目录和重定向标准输出
+    """
+    import contextlib
+    import io
+    stdout, stderr = io.StringIO(), io.StringIO()
+    cwd = os.getcwd()
+    try:
+        os.chdir(request['cwd'])
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                code = handler(request['argv'])
+            except SystemExit as e:
+                # 参数错误时argparse会直接退出
+                code = e.code if isinstance(e.code, int) else 1
+            except Exception as e:
+                print(f"❌ 转换失败: {e}", file=sys.stderr)
+                code = 1
+    except OSError as e:
+        return {'code': 1, 'stdout': '', 'stderr': f"❌ 无法进入工作目录: {e}\n"}
+    finally:
+        os.chdir(cwd)
+    return {'code': code, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+
+
+def serve(socket_path=None, handler=None, warm_up=None):
+    """
+    在前台运行常驻转换进程，监听Unix套接字，直到收到停止请求或SIGTERM
+
+    参数:
+        socket_path: 套接字路径，默认default_socket_path()
+        handler: handler(argv) -> 退出码，执行一次单文件转换的命令行调用
+        warm_up: 可选，开始监听前调用一次（如预先构建公文基础模板）
+
+    返回:
+        退出码
+    """
+    import contextlib
+    import signal
+    import socket
+
+    socket_path = socket_path or default_socket_path()
+    if _ping(socket_path):
+        print(f"❌ 常驻转换进程已在运行: {socket_path}")
+        return 1
+
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+    # 上次异常退出留下的套接字文件
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(socket_path)
+
+    if warm_up is not None:
+        warm_up()
+    version = source_version()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # 套接字文件创建时即只有本用户可访问，其他本地用户无法连接并借本账户执行转换
+    umask = os.umask(0o077)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+    os.chmod(socket_path, 0o600)
+    server.listen(16)
+    # SIGTERM时同样走finally，清理套接字文件
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"✅ 常驻转换进程已启动（进程号{os.getpid()}）: {socket_path}", flush=True)
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    request = _recv_json(conn)
+                    command = request.get('command')
+                    if command == 'ping':
+                        _send_json(conn, {'pid': os.getpid()})
+                    elif command == 'stop':
+                        _send_json(conn, {'code': 0})
+                        return 0
+                    elif request.get('version') != version:
+                        # 代码已更新：让客户端在本地转换，自身退出，避免输出旧版排版
+                        _send_json(conn, {'stale': True})
+                        print("⚠️ 转换代码已更新，常驻转换进程退出", flush=True)
+                        return 0
+                    else:
+                        _send_json(conn, _run_request(request, handler))
+                except (OSError, ValueError, KeyError):
+                    # 客户端中途断开或请求格式错误，不影响后续请求
+                    continue
+    finally:
+        server.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(socket_path)
+
+
+def start_daemon(socket_path=None):
+    """在后台启动常驻转换进程并等待其就绪，返回退出码"""
+    import subprocess
+    import time
+
+    socket_path = socket_path or default_socket_path()
+    pid = _ping(socket_path)
+    if pid:
+        print(f"✅ 常驻转换进程已在运行（进程号{pid}）: {socket_path}")
+        return 0
+
+    log_path = os.path.join(cache_dir(), DAEMON_LOG_NAME)
+    os.makedirs(cache_dir(), exist_ok=True)
+    with open(log_path, 'ab') as log:
+        subprocess.Popen([sys.executable, MAIN_SCRIPT, '--server', '--socket', socket_path],
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                         start_new_session=True, close_fds=True)
+
+    deadline = time.monotonic() + DAEMON_START_TIMEOUT
+    while time.monotonic() < deadline:
+        pid = _ping(socket_path)
+        if pid:
+            print(f"✅ 常驻转换进程已启动（进程号{pid}）: {socket_path}")
+            return 0
+        time.sleep(0.05)
+    print(f"❌ 常驻转换进程启动失败，详见日志: {log_path}")
+    return 1
+
+
+def stop_daemon(socket_path=None):
+    """停止常驻转换进程，返回退出码"""
+    socket_path = socket_path or default_socket_path()
+    try:
+        _request(socket_path, {'command': 'stop'})
+    except (OSError, ValueError):
+        print(f"❌ 常驻转换进程未在运行: {socket_path}")
+        return 1
+    print("✅ 常驻转换进程已停止")
+    return 0
+
+
+def forward_to_server(argv, socket_path=None):
+    """
+    把一次命令行调用交给常驻转换进程执行，并原样输出其结果
+
+    返回:
+        退出码；没有可用的常驻进程（或其代码已过期）时返回None，由调用方在本地转换
+    """
+    socket_path = socket_path or default_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        reply = _request(socket_path, {'command': 'convert', 'argv': argv,
+                                       'cwd': os.getcwd(), 'version': source_version()})
+    except (OSError, ValueError):
+        return None
+
+    if reply.get('stale'):
+        print("⚠️ 常驻转换进程的代码已过期并已退出，本次在当前进程中转换", file=sys.stderr)
+        return None
+
+    sys.stdout.write(reply['stdout'])
+    sys.stderr.write(reply['stderr'])
+    return reply['code']
+
+
+# ==================== 启动快速路径 ====================
+def _option_value(argv, option):
+    """在未解析的参数中查找选项的值（支持"--opt 值"和"--opt=值"）"""
+    for index, arg in enumerate(argv):
+        if arg == option and index + 1 < len(argv):
+            return argv[index + 1]
+        if arg.startswith(option + '='):
+            return arg[len(option) + 1:]
+    return None
+
+
+def run_without_docx(argv):
+    """
+    在导入python-docx之前处理命令行
+
+    用法说明、常驻进程的启动和停止、可交给常驻进程的单文件转换在这里处理完后直接退出进程；
+    其余调用（批量模式、标准输入输出、未启动常驻进程等）原样返回，由完整的命令行继续处理
+
+    参数:
+        argv: 命令行参数（不含脚本名）
+    """
+    if not argv:
+        print_usage()
+        sys.exit(1)
+
+    socket_path = _option_value(argv, '--socket') or default_socket_path()
+    if '--stop-server' in argv:
+        sys.exit(stop_daemon(socket_path))
+    if '--daemon' in argv:
+        sys.exit(start_daemon(socket_path))
+
+    if LOCAL_ONLY_OPTIONS.intersection(argv) or STDIO_PATH in argv:
+        return
+    code = forward_to_server(argv, socket_path)
+    if code is not None:
+        sys.exit(code)
@@ -6,15 +6,51 @@ Markdown转政府公文格式Word文档 - 稳定生产版本
 版本：1.0.0
 """
 
+import sys
+
+if __name__ == '__main__':
+    # 命令行启动优化：用法说明、常驻进程的启停、交给常驻转换进程的转换都不需要python-docx，
+    # 在导入之前处理完直接退出
+    from md2gov_cli import run_without_docx
+    run_without_docx(sys.argv[1:])
+    # 作为脚本运行时同时登记为md2gov_docx模块，md2gov_pdf等模块导入时不会再执行一遍本文件
+    sys.modules.setdefault('md2gov_docx', sys.modules[__name__])
+
 import docx
-from docx.shared import Pt, Mm, RGBColor
+from docx.shared import Pt, Mm, Emu, RGBColor
+from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
+from docx.oxml.table import CT_Tbl
+from docx.text.paragraph import Paragraph as DocxParagraph
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-import sys
+from docx.enum.style import WD_STYLE_TYPE
+import argparse
+import contextlib
+import copy
+import functools
+import hashlib
+import io
+import itertools
+import os
+import pickle
 import re
+import stat
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
 from pathlib import Path
+from lxml import etree
+
+from conversion_stats import (ConversionStats, STAGE_TOKENIZE, STAGE_HEADING, STAGE_PARAGRAPH,
+                              STAGE_TABLE, STAGE_SAVE)
+from md2gov_cli import STDIO_PATH, cache_dir, print_usage, serve, start_daemon, stop_daemon
 
 # ==================== 常量定义 ====================
+# 输出格式版本：排版逻辑变化导致同一输入的输出不同时递增，用于使转换缓存失效
+OUTPUT_FORMAT_VERSION = 2
+
 # 字体定义
 FONT_FANGSONG_GB2312 = '仿宋_GB2312'
 FONT_KAITI_GB2312 = '楷体_GB2312'
@@ -37,24 +73,74 @@ MARGIN_LEFT = Mm(28)
 MARGIN_RIGHT = Mm(26)
 
 
+# 段落格式默认值（正文格式），即apply_paragraph_format的默认参数
+PARAGRAPH_FORMAT_DEFAULTS = dict(alignment=WD_ALIGN_PARAGRAPH.JUSTIFY_LOW, indent=FIRST_LINE_INDENT_32,
+                                 line_spacing=LINE_SPACING_28_8, space_before=Pt(0), space_after=Pt(0))
+
+# 公文命名样式（样式模式下使用）
+# 键: (样式名, 样式ID, 字体, 字号, 是否加粗, 段落格式参数)
+# 段落格式参数只写与默认值不同的项，完整格式由resolved_paragraph_format得出；直接格式模式、
+# PDF和HTML预览也按同一张表排版
+TABLE_PARAGRAPH_FORMAT = dict(alignment=WD_ALIGN_PARAGRAPH.CENTER, indent=None, line_spacing=None,
+                              space_before=Pt(3), space_after=Pt(3))
+GOV_STYLES = {
+    'title': ('公文主标题', 'GovTitle', FONT_XIAOBIAOSONG, SIZE_ERHAO, True,
+              dict(alignment=WD_ALIGN_PARAGRAPH.CENTER, indent=Pt(0))),
+    'h1': ('一级标题', 'GovHeading1', FONT_HEITI, SIZE_SANHAO, False, {}),
+    'h2': ('二级标题', 'GovHeading2', FONT_KAITI_GB2312, SIZE_SANHAO, True, {}),
+    'h3': ('三级标题', 'GovHeading3', FONT_KAITI_GB2312, SIZE_SANHAO, False, {}),
+    'body': ('公文正文', 'GovBody', FONT_FANGSONG_GB2312, SIZE_SANHAO, False, {}),
+    'table_header': ('表格表头', 'GovTableHeader', FONT_HEITI, SIZE_SANHAO, True, TABLE_PARAGRAPH_FORMAT),
+    'table_cell': ('表格正文', 'GovTableCell', FONT_FANGSONG_GB2312, SIZE_SANHAO, False, TABLE_PARAGRAPH_FORMAT),
+}
+
+# 表格样式（Word内置的"Table Grid"网格型表格）
+TABLE_STYLE_ID = 'TableGrid'
+
+
 # ==================== Markdown模式识别 ====================
 # 标题识别（支持多种Markdown标记）
 MD_H1_PATTERN = re.compile(r'^#\s+(.+)$')           # # 主标题
 MD_H2_PATTERN = re.compile(r'^##\s+(.+)$')          # ## 一级标题
 MD_H3_PATTERN = re.compile(r'^###\s+(.+)$')         # ### 二级标题
 MD_H4_PATTERN = re.compile(r'^####\s+(.+)$')        # #### 三级标题
+MD_HEADING_PATTERN = re.compile(r'^(#{1,4})\s+(.+)$')  # 分词器使用的合并标题模式
 
 # 序号格式处理正则（用于移除序号后的空格）
 NUMBER_SPACE_PATTERN = re.compile(r'^([一二三四五六七八九十]+、|\d+\.|（[一二三四五六七八九十]+）)\s+')
+NUMBER_PREFIX_CHARS = frozenset('一二三四五六七八九十0123456789（')  # 序号可能的首字符
 
 # 列表项识别
 MD_LIST_ITEM_PATTERN = re.compile(r'^\s*[-*+☑]\s+(.+)$')
 
-# 行内格式识别
+# 行内格式识别（仅供外部参考；转换时正文和标题都由parse_inline_spans按下方的分隔符表单遍解析）
 MD_BOLD_PATTERN = re.compile(r'\*\*(.+?)\*\*')      # **加粗**
 MD_ITALIC_PATTERN = re.compile(r'\*(.+?)\*')        # *斜体*
 MD_CODE_PATTERN = re.compile(r'`(.+?)`')            # `代码`
 
+# 行内格式标志位（可按位组合）
+INLINE_BOLD = 1
+INLINE_ITALIC = 2
+INLINE_STRIKE = 4
+INLINE_CODE = 8
+
+# Word输出中有视觉差异的格式（行内代码按正文输出）
+DOCX_INLINE_FORMATS = INLINE_BOLD | INLINE_ITALIC | INLINE_STRIKE
+
+# 行内分隔符：连续的*、连续的~、反引号
+INLINE_DELIMITER_PATTERN = re.compile(r'\*+|~+|`')
+
+# 闭合加粗/斜体所需的*个数，及其反查表
+STAR_WIDTHS = {INLINE_BOLD: 2, INLINE_ITALIC: 1}
+STAR_FORMATS = {2: INLINE_BOLD, 1: INLINE_ITALIC}
+
+# 剩余*的个数 -> 依次开启的(格式, 标记)，4个及以上按原文输出
+STAR_RUN_OPENERS = {
+    1: ((INLINE_ITALIC, '*'),),
+    2: ((INLINE_BOLD, '**'),),
+    3: ((INLINE_BOLD, '**'), (INLINE_ITALIC, '*')),
+}
+
 # 分隔线
 MD_SEPARATOR_PATTERN = re.compile(r'^[-*_]{3,}$')
 
@@ -85,11 +171,11 @@ def set_run_format(run, font_name, font_size, bold=False, italic=False, color=No
 
 
 def apply_paragraph_format(p_format, 
-                          alignment=WD_ALIGN_PARAGRAPH.JUSTIFY_LOW,
-                          indent=FIRST_LINE_INDENT_32, 
-                          line_spacing=LINE_SPACING_28_8,
-                          space_before=Pt(0),
-                          space_after=Pt(0)):
+                          alignment=PARAGRAPH_FORMAT_DEFAULTS['alignment'],
+                          indent=PARAGRAPH_FORMAT_DEFAULTS['indent'], 
+                          line_spacing=PARAGRAPH_FORMAT_DEFAULTS['line_spacing'],
+                          space_before=PARAGRAPH_FORMAT_DEFAULTS['space_before'],
+                          space_after=PARAGRAPH_FORMAT_DEFAULTS['space_after']):
     """
     统一应用段落格式
     
@@ -108,58 +194,152 @@ def apply_paragraph_format(p_format,
     p_format.space_after = space_after
 
 
-def parse_inline_format(text):
+def resolved_paragraph_format(style_key):
     """
-    解析文本中的行内格式（加粗、斜体等）
+    公文样式的完整段落格式：默认值加上GOV_STYLES中该样式覆盖的项
+    Word（直接格式和命名样式）、PDF、HTML预览都由此取段落格式，保证各输出一致
     
-    返回: [(文本片段, 是否加粗, 是否斜体), ...]
+    参数:
+        style_key: GOV_STYLES中的样式键
+    
+    返回:
+        dict(alignment, indent, line_spacing, space_before, space_after)，可直接传给apply_paragraph_format
     """
-    segments = []
-    pos = 0
+    return dict(PARAGRAPH_FORMAT_DEFAULTS, **GOV_STYLES[style_key][5])
+
+
+def parse_inline_spans(text):
+    """
+    单遍扫描解析行内格式（加粗、斜体、删除线、行内代码）
+    
+    每个分隔符只查找一次，开启标记按顺序记录。1个或2个连续的*只闭合宽度
+    相等的已开启格式（斜体/加粗），否则开启新格式，因此加粗和斜体可以互相嵌套；
+    3个及以上的*由内向外闭合，剩余的*再开启新格式。
+    扫描结束后仍未闭合的标记按原文输出。整体为线性时间，相邻的同格式片段会合并为一段，
+    避免逐字符生成Run。
+    
+    返回: [(文本片段, 格式标志位), ...]，标志位为INLINE_*的组合
     
-    # 匹配所有行内格式标记
-    patterns = [
-        (MD_BOLD_PATTERN, True, False),   # 加粗
-        (MD_ITALIC_PATTERN, False, True),  # 斜体
-    ]
+    示例（可用python -m doctest md2gov_docx.py检查）:
+    >>> parse_inline_spans('*a **b** c*')
+    [('a ', 2), ('b', 3), (' c', 2)]
+    >>> parse_inline_spans('**a *b* c**')
+    [('a ', 1), ('b', 3), (' c', 1)]
+    >>> parse_inline_spans('*a **b* c')
+    [('a **b', 2), (' c', 0)]
+    >>> parse_inline_spans('***a*** b')
+    [('a', 3), (' b', 0)]
+    """
+    if '*' not in text and '~' not in text and '`' not in text:
+        return [(text, 0)]
+    
+    pieces = []     # [文本, 标志位]；开启标记先作为占位片段写入
+    openers = {}    # 格式 -> 开启标记所在的片段下标
+    flags = 0
+    pos = 0
     
-    while pos < len(text):
-        matched = False
+    while True:
+        match = INLINE_DELIMITER_PATTERN.search(text, pos)
+        if match is None:
+            break
         
-        # 尝试匹配加粗（优先级更高）
-        bold_match = MD_BOLD_PATTERN.match(text, pos)
-        if bold_match:
-            segments.append((bold_match.group(1), True, False))
-            pos = bold_match.end()
-            matched = True
-            continue
+        start, end = match.span()
+        if start > pos:
+            pieces.append([text[pos:start], flags])
+        delimiter = match.group()
+        pos = end
         
-        # 尝试匹配斜体
-        italic_match = MD_ITALIC_PATTERN.match(text, pos)
-        if italic_match:
-            segments.append((italic_match.group(1), False, True))
-            pos = italic_match.end()
-            matched = True
+        # 行内代码：内容原样保留，不再解析其中的标记
+        if delimiter == '`':
+            close = text.find('`', end)
+            if close > end:
+                pieces.append([text[end:close], flags | INLINE_CODE])
+                pos = close + 1
+            else:
+                pieces.append([delimiter, flags])
             continue
         
-        # 没有匹配到格式标记，添加普通字符
-        if not matched:
-            # 找到下一个可能的格式标记位置
-            next_pos = len(text)
-            for pattern, _, _ in patterns:
-                match = pattern.search(text, pos)
-                if match and match.start() < next_pos:
-                    next_pos = match.start()
-            
-            # 添加普通文本片段
-            if next_pos > pos:
-                segments.append((text[pos:next_pos], False, False))
-                pos = next_pos
+        if delimiter[0] == '~':
+            if len(delimiter) != 2:
+                pieces.append([delimiter, flags])
+                continue
+            if flags & INLINE_STRIKE:
+                closing, opening = (INLINE_STRIKE,), ()
+            else:
+                closing, opening = (), ((INLINE_STRIKE, delimiter),)
+        else:
+            remaining = len(delimiter)
+            closing = []
+            exact = STAR_FORMATS.get(remaining)
+            if exact is not None:
+                # 1个或2个*只闭合同宽度的格式，否则作为新的开启标记
+                candidates = (exact,) if exact in openers else ()
             else:
-                segments.append((text[pos], False, False))
-                pos += 1
+                candidates = reversed(list(openers))
+            for fmt in candidates:
+                width = STAR_WIDTHS.get(fmt)
+                if width and remaining >= width:
+                    closing.append(fmt)
+                    remaining -= width
+            opening = STAR_RUN_OPENERS.get(remaining, ()) if remaining else ()
+            if remaining and not opening:
+                pieces.append(['*' * remaining, flags])
+        
+        # 闭合：对应的开启标记不再输出
+        for fmt in closing:
+            pieces[openers.pop(fmt)][0] = ''
+            flags &= ~fmt
+        
+        for fmt, marker in opening:
+            openers[fmt] = len(pieces)
+            pieces.append([marker, flags])
+            flags |= fmt
+    
+    if pos < len(text):
+        pieces.append([text[pos:], flags])
+    
+    # 未闭合的开启标记按原文输出，其后的片段去掉该格式
+    for fmt, index in openers.items():
+        for piece in pieces[index + 1:]:
+            piece[1] &= ~fmt
+    
+    # 合并相邻同格式片段
+    spans = []
+    for content, fmt in pieces:
+        if not content:
+            continue
+        if spans and spans[-1][1] == fmt:
+            spans[-1][0].append(content)
+        else:
+            spans.append(([content], fmt))
+    
+    return [(''.join(parts), fmt) for parts, fmt in spans] or [(text, 0)]
+
+
+def merge_inline_spans(spans, mask):
+    """
+    只保留mask中的格式位，并合并因此变为同格式的相邻片段
+    
+    返回: [(文本片段, 格式标志位), ...]
+    """
+    merged = []
+    for content, fmt in spans:
+        fmt &= mask
+        if merged and merged[-1][1] == fmt:
+            merged[-1][0].append(content)
+        else:
+            merged.append(([content], fmt))
+    return [(''.join(parts), fmt) for parts, fmt in merged]
+
+
+def parse_inline_format(text):
+    """
+    解析文本中的行内格式（加粗、斜体等）
     
-    return segments if segments else [(text, False, False)]
+    返回: [(文本片段, 是否加粗, 是否斜体), ...]
+    """
+    return [(content, bool(fmt & INLINE_BOLD), bool(fmt & INLINE_ITALIC))
+            for content, fmt in parse_inline_spans(text)]
 
 
 def remove_number_space(text):
@@ -175,40 +355,206 @@ def remove_number_space(text):
 def clean_markdown_marks(text):
     """
     清理文本中的Markdown格式标记（用于标题等不需要格式的地方）
-    移除：**加粗**、*斜体*、`代码` 等标记
+    移除：**加粗**、*斜体*、`代码`、~~删除线~~ 等标记
+    与正文共用parse_inline_spans的单遍解析，只保留文字；未闭合的标记按原文保留
     
     例如："**一级标题**" -> "一级标题"
           "*重要*内容" -> "重要内容"
     """
-    # 移除加粗标记 **text**
-    text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)
-    # 移除斜体标记 *text*
-    text = re.sub(r'\*(.+?)\*', r'\1', text)
-    # 移除代码标记 `text`
-    text = re.sub(r'`(.+?)`', r'\1', text)
-    # 移除删除线 ~~text~~
-    text = re.sub(r'~~(.+?)~~', r'\1', text)
-    return text
+    return ''.join(content for content, _ in parse_inline_spans(text))
+
+
+def body_spans(text):
+    """
+    正文、列表项的行内片段：移除序号后的空格，再解析行内格式
+    
+    返回: [(文本片段, 格式标志位), ...]
+    """
+    return parse_inline_spans(remove_number_space(text))
 
 
-def add_formatted_text(paragraph, text, base_font, base_size):
+def add_formatted_text(paragraph, text, base_font, base_size, spans=None):
     """
-    向段落添加带格式的文本（处理加粗、斜体等）
+    向段落添加带格式的文本（处理加粗、斜体、删除线等，行内代码按正文输出）
     
     参数:
         paragraph: 段落对象
         text: 文本内容
         base_font: 基础字体
         base_size: 基础字号
+        spans: 已解析的行内片段（body_spans的结果），可选，提供时不再解析text
+    """
+    if spans is None:
+        spans = body_spans(text)
+    
+    segments = merge_inline_spans(spans, DOCX_INLINE_FORMATS)
+    for content, fmt in segments:
+        if content:
+            run = paragraph.add_run(content)
+            set_run_format(run, base_font, base_size,
+                           bold=bool(fmt & INLINE_BOLD), italic=bool(fmt & INLINE_ITALIC))
+            if fmt & INLINE_STRIKE:
+                run.font.strike = True
+
+
+def add_styled_text(paragraph, text, spans=None):
+    """
+    样式模式下向段落添加带格式的文本
+    字体字号由段落样式提供，Run上只写加粗、斜体、删除线
+    
+    参数:
+        paragraph: 段落对象（已设置段落样式）
+        text: 文本内容
+        spans: 已解析的行内片段，可选，提供时不再解析text
     """
-    # 移除序号后的空格
-    text = remove_number_space(text)
+    if spans is None:
+        spans = body_spans(text)
     
-    segments = parse_inline_format(text)
-    for content, bold, italic in segments:
+    for content, fmt in merge_inline_spans(spans, DOCX_INLINE_FORMATS):
         if content:
             run = paragraph.add_run(content)
-            set_run_format(run, base_font, base_size, bold=bold, italic=italic)
+            if fmt & INLINE_BOLD:
+                run.font.bold = True
+            if fmt & INLINE_ITALIC:
+                run.font.italic = True
+            if fmt & INLINE_STRIKE:
+                run.font.strike = True
+
+
+def is_plain_text(text):
+    """
+    判断正文是否为纯文本：不含行内格式分隔符（* ~ `），也不以"序号+空格"开头
+    纯文本段落只有一个Run，排版结果与逐段解析完全相同，可走快速路径
+    """
+    if not text or '*' in text or '~' in text or '`' in text:
+        return False
+    return text[0] not in NUMBER_PREFIX_CHARS or NUMBER_SPACE_PATTERN.match(text) is None
+
+
+# 纯文本正文段落模板缓存：是否使用命名样式 -> w:p元素
+_PLAIN_PARAGRAPH_TEMPLATES = {}
+
+
+def _build_plain_paragraph_template(use_styles=False):
+    """
+    构建正文段落模板（w:p），段落属性和唯一Run的属性与add_block_text的结果一致
+    
+    参数:
+        use_styles: True时段落只引用公文正文样式
+    
+    返回:
+        w:p元素（不含文本）
+    """
+    _, style_id, font_name, font_size, bold, _ = GOV_STYLES['body']
+    paragraph = DocxParagraph(OxmlElement('w:p'), None)
+    
+    if use_styles:
+        paragraph._p.style = style_id
+        paragraph.add_run()
+        return paragraph._p
+    
+    apply_paragraph_format(paragraph.paragraph_format, **resolved_paragraph_format('body'))
+    set_run_format(paragraph.add_run(), font_name, font_size, bold=bold)
+    return paragraph._p
+
+
+def add_plain_paragraph(doc, text, use_styles=False):
+    """
+    正文快速路径：复制预先构建的段落模板并写入文本，不做序号空格处理和行内格式解析
+    调用方需先用is_plain_text确认文本不含格式标记
+    
+    参数:
+        doc: Word文档对象
+        text: 纯文本内容
+        use_styles: 是否使用公文命名样式代替直接格式
+    
+    返回:
+        新增的w:p元素
+    """
+    template = _PLAIN_PARAGRAPH_TEMPLATES.get(use_styles)
+    if template is None:
+        template = _PLAIN_PARAGRAPH_TEMPLATES[use_styles] = _build_plain_paragraph_template(use_styles)
+    
+    p = copy.deepcopy(template)
+    _set_run_text(p[-1], text)
+    doc.element.body._insert_p(p)
+    return p
+
+
+# 标题段落渲染缓存容量（编号标题如"一、总体要求"在批量转换中大量重复）
+HEADING_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=HEADING_CACHE_SIZE)
+def _heading_template(style_key, text, use_styles):
+    """渲染标题段落（w:p），相同的标题文本只清理标记、排版一次"""
+    paragraph = DocxParagraph(OxmlElement('w:p'), None)
+    add_block_text(paragraph, clean_markdown_marks(text), style_key, use_styles)
+    return paragraph._p
+
+
+def add_heading_paragraph(doc, style_key, text, use_styles=False):
+    """
+    向文档添加标题段落，复制缓存的渲染结果
+    
+    参数:
+        doc: Word文档对象
+        style_key: 'title'、'h1'、'h2' 或 'h3'
+        text: 标题文本（未清理格式标记）
+        use_styles: 是否使用公文命名样式代替直接格式
+    
+    返回:
+        新增的w:p元素
+    """
+    p = copy.deepcopy(_heading_template(style_key, text, use_styles))
+    doc.element.body._insert_p(p)
+    return p
+
+
+def add_block_text(paragraph, text, style_key, use_styles=False, spans=None):
+    """
+    按公文样式表向段落添加一整段文本（标题、正文、列表项）
+    
+    参数:
+        paragraph: 段落对象
+        text: 文本内容（标题需预先清理格式标记）
+        style_key: GOV_STYLES中的样式键
+        use_styles: True时只引用命名样式，False时直接写入段落和字符格式
+        spans: 正文已解析的行内片段，可选
+    """
+    _, style_id, font_name, font_size, bold, _ = GOV_STYLES[style_key]
+    is_heading = style_key != 'body'
+    
+    if use_styles:
+        # 直接写样式ID，避免python-docx按对象查找样式的开销
+        paragraph._p.style = style_id
+        if is_heading:
+            paragraph.add_run(text)
+        else:
+            add_styled_text(paragraph, text, spans)
+        return
+    
+    apply_paragraph_format(paragraph.paragraph_format, **resolved_paragraph_format(style_key))
+    if is_heading:
+        run = paragraph.add_run(text)
+        set_run_format(run, font_name, font_size, bold=bold)
+    else:
+        add_formatted_text(paragraph, text, font_name, font_size, spans)
+
+
+def register_gov_styles(doc):
+    """
+    在文档中注册公文命名样式（公文正文、一级标题、表格表头等）
+    样式基于Normal，只包含直接格式模式下逐段、逐Run写入的那些属性
+    """
+    normal = doc.styles['Normal']
+    for style_key, (name, style_id, font_name, font_size, bold, _) in GOV_STYLES.items():
+        style = doc.styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH)
+        style.style_id = style_id
+        style.base_style = normal
+        style.quick_style = True
+        apply_paragraph_format(style.paragraph_format, **resolved_paragraph_format(style_key))
+        set_run_format(style, font_name, font_size, bold=bold)
 
 
 def setup_page_margins(doc):
@@ -237,240 +583,1601 @@ def parse_table_row(line):
     return cells
 
 
-def add_table_to_doc(doc, table_data):
+# 表格单元格模板缓存：(样式键, 是否使用命名样式) -> w:tc元素
+_TABLE_CELL_TEMPLATES = {}
+
+
+def _build_table_cell_template(style_key, use_styles=False):
+    """
+    构建表格单元格模板（w:tc），段落和Run属性与逐格设置格式的结果一致
+    
+    参数:
+        style_key: 'table_header'（表头）或 'table_cell'（表格正文）
+        use_styles: True时段落只引用公文命名样式
+    
+    返回:
+        w:tc元素（不含单元格宽度和文本）
+    """
+    tc = OxmlElement('w:tc')
+    paragraph = DocxParagraph(etree.SubElement(tc, qn('w:p')), None)
+    
+    if use_styles:
+        paragraph._p.style = GOV_STYLES[style_key][1]
+        paragraph.add_run()
+        return tc
+    
+    paragraph.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    paragraph.paragraph_format.space_before = Pt(3)
+    paragraph.paragraph_format.space_after = Pt(3)
+    
+    # 表头加粗
+    _, _, font_name, font_size, bold, _ = GOV_STYLES[style_key]
+    set_run_format(paragraph.add_run(), font_name, font_size, bold=bold)
+    return tc
+
+
+def _table_cell_template(style_key, use_styles=False):
+    """获取共享的表格单元格模板（每个进程只构建一次）"""
+    key = (style_key, use_styles)
+    template = _TABLE_CELL_TEMPLATES.get(key)
+    if template is None:
+        template = _TABLE_CELL_TEMPLATES[key] = _build_table_cell_template(style_key, use_styles)
+    return template
+
+
+def _set_cell_text(tc, text):
+    """把文本写入单元格模板副本中唯一的Run"""
+    if text:
+        _set_run_text(tc[-1][-1], text)
+
+
+def _set_run_text(r, text):
+    """把文本写入模板副本中的空Run"""
+    if text.isprintable():
+        # 常见情况：无制表符、换行等特殊字符，直接追加w:t
+        etree.SubElement(r, qn('w:t')).text = text
+    else:
+        r.text = text
+
+
+def add_table_to_doc(doc, table_data, use_styles=False):
     """
     向Word文档添加表格
+    直接一次性构建w:tbl元素，单元格由共享模板复制而来，不经过python-docx的行列代理对象
     
     参数:
         doc: Word文档对象
         table_data: 表格数据 [[header1, header2, ...], [row1col1, row1col2, ...], ...]
+                    各行单元格数可以不同，列数取最宽的一行，较短的行以空单元格补齐
+        use_styles: True时单元格段落只引用表格表头/表格正文样式
+    
+    返回:
+        新增的w:tbl元素，数据不足两行（只有表头）时不添加表格，返回None
     """
     if not table_data or len(table_data) < 2:
-        return
+        return None
     
-    # 创建表格
-    rows = len(table_data)
-    cols = len(table_data[0])
-    table = doc.add_table(rows=rows, cols=cols)
+    # 创建表格：列宽平均分配版心宽度，与doc.add_table一致
+    cols = max(len(row_data) for row_data in table_data)
+    table_width = doc._block_width
+    tbl = CT_Tbl.new_tbl(0, cols, table_width)
     
     # 设置表格样式
-    table.style = 'Table Grid'
+    tbl.tblStyle_val = TABLE_STYLE_ID
+    
+    # 本表的单元格模板：共享模板加上本表的列宽
+    col_width = str(Emu(table_width // cols).twips)
+    cell_templates = []
+    for style_key in ('table_header', 'table_cell'):
+        tc = copy.deepcopy(_table_cell_template(style_key, use_styles))
+        tc_pr = tc._add_tcPr()
+        etree.SubElement(tc_pr, qn('w:tcW'), {qn('w:type'): 'dxa', qn('w:w'): col_width})
+        cell_templates.append(tc)
     
     # 填充表格内容
     for i, row_data in enumerate(table_data):
-        row = table.rows[i]
-        for j, cell_text in enumerate(row_data):
-            if j < len(row.cells):
-                cell = row.cells[j]
-                # 设置单元格文本
-                cell.text = cell_text
-                
-                # 设置单元格格式
-                for paragraph in cell.paragraphs:
-                    paragraph.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                    paragraph.paragraph_format.space_before = Pt(3)
-                    paragraph.paragraph_format.space_after = Pt(3)
-                    
-                    for run in paragraph.runs:
-                        # 表头加粗
-                        if i == 0:
-                            set_run_format(run, FONT_HEITI, SIZE_SANHAO, bold=True)
-                        else:
-                            set_run_format(run, FONT_FANGSONG_GB2312, SIZE_SANHAO)
+        template = cell_templates[0 if i == 0 else 1]
+        tr = etree.SubElement(tbl, qn('w:tr'))
+        for j in range(cols):
+            tc = copy.deepcopy(template)
+            if j < len(row_data):
+                _set_cell_text(tc, row_data[j])
+            tr.append(tc)
+    
+    doc.element.body._insert_tbl(tbl)
     
     # 表格后添加空行
     doc.add_paragraph()
+    return tbl
 
 
-# ==================== 核心转换函数 ====================
-def convert_markdown_to_gov_docx(md_path, docx_path):
+# ==================== 公文基础模板 ====================
+# 基础模板在每个进程中只解析一次，之后每次转换都从模板克隆
+_BASE_TEMPLATE = None
+_BASE_TEMPLATE_LOCK = threading.Lock()
+
+# 基础模板还会保存到磁盘缓存：命令行每次都是新进程，加载缓存的.docx比重新构建快
+# 设置环境变量MD2GOV_TEMPLATE_CACHE=0可禁用
+TEMPLATE_CACHE_ENV = 'MD2GOV_TEMPLATE_CACHE'
+
+
+def _build_base_template():
     """
-    将Markdown文件转换为政府公文格式的Word文档
+    构建公文基础模板
+    在python-docx默认模板的基础上预先设置好页边距，并注册公文命名样式
+    """
+    doc = docx.Document()
+    setup_page_margins(doc)
+    register_gov_styles(doc)
+    return doc
+
+
+def _template_cache_path():
+    """基础模板缓存文件路径，随本模块源码和python-docx版本变化"""
+    digest = hashlib.sha256(Path(__file__).read_bytes())
+    digest.update(getattr(docx, '__version__', '').encode('utf-8'))
+    return Path(cache_dir()) / f"template-{digest.hexdigest()[:16]}.docx"
+
+
+def _load_base_template():
+    """
+    加载公文基础模板：优先读取磁盘缓存，没有缓存或缓存损坏时重新构建并写入缓存
+    缓存目录不可写时只在内存中使用
+    """
+    if os.environ.get(TEMPLATE_CACHE_ENV) == '0':
+        return _build_base_template()
+    
+    try:
+        path = _template_cache_path()
+        if path.exists():
+            return docx.Document(str(path))
+    except Exception:
+        pass
+    
+    doc = _build_base_template()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再替换，并发启动的进程不会读到写了一半的缓存
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        doc.save(str(temp_path))
+        os.replace(temp_path, path)
+        # 清理旧版本的模板缓存
+        for old_path in path.parent.glob('template-*.docx'):
+            if old_path != path:
+                old_path.unlink()
+    except OSError:
+        pass
+    return doc
+
+
+def new_gov_document():
+    """
+    创建一个新的公文格式文档
+    
+    每次调用docx.Document()都要解压并解析自带的default.docx，
+    这里改为深拷贝已解析好的基础模板，省去每篇文档的固定开销；
+    基础模板本身也缓存在磁盘上，新进程不必重新构建。
+    
+    返回:
+        docx.Document对象（已设置页边距、已注册公文样式）
+    """
+    global _BASE_TEMPLATE
+    if _BASE_TEMPLATE is None:
+        with _BASE_TEMPLATE_LOCK:
+            if _BASE_TEMPLATE is None:
+                _BASE_TEMPLATE = _load_base_template()
+    return copy.deepcopy(_BASE_TEMPLATE)
+
+
+# ==================== 块级分词 ====================
+# 块类型（标题类块与GOV_STYLES的样式键一致）
+BLOCK_TITLE = 'title'        # 主标题（第一个 # 标题）
+BLOCK_H1 = 'h1'              # ## 一级标题
+BLOCK_H2 = 'h2'              # ### 二级标题
+BLOCK_H3 = 'h3'              # #### 三级标题
+BLOCK_LIST_ITEM = 'list'     # 列表项
+BLOCK_PARAGRAPH = 'body'     # 普通正文
+BLOCK_TABLE = 'table'        # 表格（内容为单元格二维列表）
+
+# 标题级数（#的个数）-> 块类型
+HEADING_BLOCKS = {2: BLOCK_H1, 3: BLOCK_H2, 4: BLOCK_H3}
+
+# 块类型对应的统计阶段
+BLOCK_STAGES = {
+    BLOCK_TITLE: STAGE_HEADING, BLOCK_H1: STAGE_HEADING, BLOCK_H2: STAGE_HEADING, BLOCK_H3: STAGE_HEADING,
+    BLOCK_LIST_ITEM: STAGE_PARAGRAPH, BLOCK_PARAGRAPH: STAGE_PARAGRAPH, BLOCK_TABLE: STAGE_TABLE,
+}
+
+# 可能开启分隔线或列表项的首字符
+SEPARATOR_CHARS = '-*_'
+LIST_MARKER_CHARS = '-*+☑'
+
+
+def classify_line(text, is_first_heading):
+    """
+    对单行（已去除首尾空白、非空、非表格）做一次分派，返回(块类型, 内容)
+    
+    按首字符分派，每行最多执行一次正则匹配；
+    分隔线返回(None, None)
     
     参数:
-        md_path: Markdown文件路径
-        docx_path: 输出的Word文档路径
+        text: 行文本
+        is_first_heading: 是否尚未出现主标题
+    """
+    first = text[0]
+    
+    if first == '#':
+        match = MD_HEADING_PATTERN.match(text)
+        if match:
+            level = len(match.group(1))
+            if level > 1:
+                return HEADING_BLOCKS[level], match.group(2)
+            if is_first_heading:
+                return BLOCK_TITLE, match.group(2)
+        # 非首个 # 标题按正文处理
+        return BLOCK_PARAGRAPH, text
+    
+    if first in SEPARATOR_CHARS and MD_SEPARATOR_PATTERN.match(text):
+        return None, None
+    
+    if first in LIST_MARKER_CHARS:
+        match = MD_LIST_ITEM_PATTERN.match(text)
+        if match:
+            return BLOCK_LIST_ITEM, match.group(1)
+    
+    return BLOCK_PARAGRAPH, text
+
+
+def iter_markdown_lines(source, encoding='utf-8'):
+    """
+    把各种输入统一为逐行产出的文本行，不把全文读入列表
+    
+    参数:
+        source: Markdown字符串、文本或二进制模式的文件对象（如sys.stdin、Flask的request.stream），
+                或任意产出str/bytes行的可迭代对象
+        encoding: 二进制行的解码方式
     
     返回:
-        成功返回True，失败返回False
+        生成器，逐行产出str
     """
-    try:
-        # 检查输入文件是否存在
-        md_file = Path(md_path)
-        if not md_file.exists():
-            print(f"❌ 错误：输入文件不存在: {md_path}")
-            return False
-        
-        # 读取Markdown内容
-        with open(md_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        # 创建Word文档
-        doc = docx.Document()
-        
-        # 设置页面边距
-        setup_page_margins(doc)
-        
-        # 标记第一个标题（作为主标题）
-        is_first_heading = True
+    if isinstance(source, bytes):
+        source = source.decode(encoding)
+    if isinstance(source, str):
+        # 按通用换行符分行，与以文本模式打开文件的行为一致
+        source = io.StringIO(source, newline=None)
+    
+    for line in source:
+        # 按\n切分的UTF-8字节行总是完整的字符序列，可以逐行解码
+        if isinstance(line, bytes):
+            line = line.decode(encoding)
+        yield line
+
+
+def tokenize_markdown(lines):
+    """
+    块级分词：把Markdown文本行切分为块流
+    
+    参数:
+        lines: Markdown文本行，任意可迭代对象（列表、文件对象、生成器），只顺序读取一遍
+    
+    返回:
+        生成器，逐个产出(块类型, 内容)：
+        标题、列表项、正文的内容为文本（标题未清理格式标记），表格的内容为单元格二维列表
+    """
+    is_first_heading = True
+    
+    # 只需向前多看一行（判断表格分隔符），内存占用与输入长度无关
+    source = iter(lines)
+    lookahead = next(source, None)
+    while lookahead is not None:
+        text = lookahead.strip()
+        lookahead = next(source, None)
         
-        # 表格处理状态
-        in_table = False
-        table_data = []
+        if not text:
+            continue
         
-        # 逐行处理
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            text = line.strip()
-            
-            # 跳过空行和分隔线
-            if not text or MD_SEPARATOR_PATTERN.match(text):
-                i += 1
-                continue
-            
-            # ============ 检测表格 ============
-            if '|' in text and i + 1 < len(lines):
-                next_line = lines[i + 1].strip()
-                # 检查下一行是否是表格分隔符
-                if MD_TABLE_SEPARATOR.match(next_line):
-                    # 开始解析表格
-                    in_table = True
-                    table_data = []
-                    
-                    # 表头
-                    table_data.append(parse_table_row(text))
-                    i += 1  # 跳过分隔符行
-                    i += 1
-                    
-                    # 读取表格数据行
-                    while i < len(lines):
-                        row_text = lines[i].strip()
-                        if not row_text or '|' not in row_text:
-                            break
-                        table_data.append(parse_table_row(row_text))
-                        i += 1
-                    
-                    # 添加表格到文档
-                    add_table_to_doc(doc, table_data)
-                    in_table = False
-                    continue
-            
-            # 创建新段落
-            para = doc.add_paragraph()
-            
-            # ============ 1. 主标题（第一个一级标题）============
-            match = MD_H1_PATTERN.match(text)
-            if match and is_first_heading:
-                is_first_heading = False
-                title_text = clean_markdown_marks(match.group(1))  # 清理格式标记
-                apply_paragraph_format(
-                    para.paragraph_format,
-                    alignment=WD_ALIGN_PARAGRAPH.CENTER,
-                    indent=Pt(0),
-                    line_spacing=LINE_SPACING_28_8
-                )
-                run = para.add_run(title_text)
-                set_run_format(run, FONT_XIAOBIAOSONG, SIZE_ERHAO, bold=True)
-                
-                # 主标题后添加空行
-                doc.add_paragraph()
-                i += 1
-                continue
-            
-            # ============ 2. 一级标题（## 开头）============
-            match = MD_H2_PATTERN.match(text)
-            if match:
-                heading_text = clean_markdown_marks(match.group(1))  # 清理格式标记
-                apply_paragraph_format(para.paragraph_format)
-                run = para.add_run(heading_text)
-                set_run_format(run, FONT_HEITI, SIZE_SANHAO)
-                i += 1
-                continue
-            
-            # ============ 3. 二级标题（### 开头）============
-            match = MD_H3_PATTERN.match(text)
-            if match:
-                heading_text = clean_markdown_marks(match.group(1))  # 清理格式标记
-                apply_paragraph_format(para.paragraph_format)
-                run = para.add_run(heading_text)
-                set_run_format(run, FONT_KAITI_GB2312, SIZE_SANHAO, bold=True)
-                i += 1
-                continue
-            
-            # ============ 4. 三级标题（#### 开头）============
-            match = MD_H4_PATTERN.match(text)
-            if match:
-                heading_text = clean_markdown_marks(match.group(1))  # 清理格式标记
-                apply_paragraph_format(para.paragraph_format)
-                run = para.add_run(heading_text)
-                set_run_format(run, FONT_KAITI_GB2312, SIZE_SANHAO)
-                i += 1
-                continue
-            
-            # ============ 5. 列表项 ============
-            match = MD_LIST_ITEM_PATTERN.match(text)
-            if match:
-                list_text = match.group(1)
-                apply_paragraph_format(para.paragraph_format)
-                add_formatted_text(para, list_text, FONT_FANGSONG_GB2312, SIZE_SANHAO)
-                i += 1
-                continue
+        # 表格：当前行含 | 且下一行是表格分隔符
+        if '|' in text and lookahead is not None and MD_TABLE_SEPARATOR.match(lookahead.strip()):
+            table_data = [parse_table_row(text)]
+            lookahead = next(source, None)  # 跳过分隔符行
             
-            # ============ 6. 普通正文 ============
-            apply_paragraph_format(para.paragraph_format)
-            add_formatted_text(para, text, FONT_FANGSONG_GB2312, SIZE_SANHAO)
+            # 读取表格数据行，遇到的第一个非表格行留给外层循环处理
+            while lookahead is not None:
+                row_text = lookahead.strip()
+                if not row_text or '|' not in row_text:
+                    break
+                table_data.append(parse_table_row(row_text))
+                lookahead = next(source, None)
             
-            i += 1
-        
-        # 保存文档
-        output_path = Path(docx_path)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        doc.save(docx_path)
-        
-        print(f"✅ 转换成功！")
-        print(f"   输入: {md_path}")
-        print(f"   输出: {docx_path}")
-        return True
+            yield BLOCK_TABLE, table_data
+            continue
         
-    except Exception as e:
-        print(f"❌ 转换失败: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+        kind, content = classify_line(text, is_first_heading)
+        if kind is None:
+            continue
+        if kind == BLOCK_TITLE:
+            is_first_heading = False
+        yield kind, content
 
 
-# ==================== 命令行入口 ====================
-def main():
-    """命令行主函数"""
-    if len(sys.argv) != 3:
-        print("\n" + "="*60)
-        print("Markdown转政府公文格式Word文档工具 v1.0.0")
-        print("="*60)
-        print("\n使用方法:")
-        print(f"  python {Path(__file__).name} <输入.md文件> <输出.docx文件>")
-        print("\n示例:")
-        print(f"  python {Path(__file__).name} report.md report_formatted.docx")
-        print("\n支持的Markdown语法:")
-        print("  # 主标题        -> 方正小标宋简体 22磅 加粗 居中")
-        print("  ## 一级标题     -> 黑体 16磅")
-        print("  ### 二级标题    -> 楷体_GB2312 16磅 加粗")
-        print("  #### 三级标题   -> 楷体_GB2312 16磅")
-        print("  - 列表项        -> 仿宋_GB2312 16磅")
-        print("  正文            -> 仿宋_GB2312 16磅")
-        print("  **加粗**        -> 加粗")
-        print("  *斜体*          -> 斜体")
-        print("\n注意事项:")
-        print("  - 请确保系统已安装所需字体（仿宋_GB2312、楷体_GB2312等）")
-        print("  - macOS用户可在'字体册'中检查字体")
-        print("="*60 + "\n")
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
-    
-    success = convert_markdown_to_gov_docx(input_file, output_file)
-    sys.exit(0 if success else 1)
+# ==================== 文档模型 ====================
+# 解析结果的节点类型。节点使用__slots__，不带实例字典，内存占用与元组相当；
+# 可按(块类型, 内容)解包，与tokenize_markdown产出的块通用，接收块的函数不区分两者。
+# __reduce__只保存构造参数，pickle结果紧凑，可写入缓存或发送给工作进程后直接重新输出
+
+# Markdown标题级数（#的个数）-> 块类型，主标题为1级
+HEADING_LEVEL_BLOCKS = {1: BLOCK_TITLE, **HEADING_BLOCKS}
+BLOCK_HEADING_LEVELS = {kind: level for level, kind in HEADING_LEVEL_BLOCKS.items()}
+
+
+class InlineSpan:
+    """行内片段：文本及格式标志位（INLINE_*的组合），可按(文本, 标志位)解包"""
+    
+    __slots__ = ('text', 'flags')
+    
+    def __init__(self, text, flags=0):
+        self.text = text
+        self.flags = flags
+    
+    def __iter__(self):
+        return iter((self.text, self.flags))
+    
+    def __eq__(self, other):
+        return isinstance(other, InlineSpan) and self.text == other.text and self.flags == other.flags
+    
+    def __repr__(self):
+        return f"InlineSpan({self.text!r}, {self.flags})"
+    
+    def __reduce__(self):
+        return InlineSpan, (self.text, self.flags)
+
+
+class Block:
+    """块节点基类：kind为块类型（BLOCK_*），content为add_block_to_doc使用的块内容"""
+    
+    __slots__ = ()
+    kind = None
+    content = None
+    spans = None    # 正文、列表项的行内片段，其他块没有
+    
+    def __iter__(self):
+        return iter((self.kind, self.content))
+    
+    def __eq__(self, other):
+        return type(other) is type(self) and self.__reduce__() == other.__reduce__()
+    
+    def __repr__(self):
+        return f"{type(self).__name__}{self.__reduce__()[1]!r}"
+
+
+class Heading(Block):
+    """标题：level为Markdown标题级数（1为主标题，2~4为一~三级标题），text未清理格式标记"""
+    
+    __slots__ = ('level', 'text')
+    
+    def __init__(self, level, text):
+        self.level = level
+        self.text = text
+    
+    @property
+    def kind(self):
+        return HEADING_LEVEL_BLOCKS[self.level]
+    
+    @property
+    def content(self):
+        return self.text
+    
+    def __reduce__(self):
+        return Heading, (self.level, self.text)
+
+
+class Paragraph(Block):
+    """正文段落：text为原文，spans为解析好的行内片段（已移除序号后的空格）"""
+    
+    __slots__ = ('text', 'spans')
+    kind = BLOCK_PARAGRAPH
+    
+    def __init__(self, text, spans=None):
+        self.text = text
+        if spans is None:
+            if is_plain_text(text):
+                spans = (InlineSpan(text),)
+            else:
+                spans = tuple(InlineSpan(content, fmt) for content, fmt in body_spans(text))
+        self.spans = spans
+    
+    @property
+    def content(self):
+        return self.text
+    
+    def __reduce__(self):
+        # 纯文本段落的片段就是原文，不重复保存，恢复时由is_plain_text直接得出
+        if is_plain_text(self.text):
+            return type(self), (self.text,)
+        return type(self), (self.text, self.spans)
+
+
+class ListItem(Paragraph):
+    """列表项：与正文段落排版相同"""
+    
+    __slots__ = ()
+    kind = BLOCK_LIST_ITEM
+
+
+class Table(Block):
+    """表格：rows为单元格文本的二维元组，第一行为表头"""
+    
+    __slots__ = ('rows',)
+    kind = BLOCK_TABLE
+    
+    def __init__(self, rows):
+        self.rows = tuple(tuple(row) for row in rows)
+    
+    @property
+    def content(self):
+        return self.rows
+    
+    def __reduce__(self):
+        return Table, (self.rows,)
+
+
+def make_block(kind, content):
+    """由(块类型, 内容)构建块节点"""
+    if kind == BLOCK_PARAGRAPH:
+        return Paragraph(content)
+    if kind == BLOCK_LIST_ITEM:
+        return ListItem(content)
+    if kind == BLOCK_TABLE:
+        return Table(content)
+    return Heading(BLOCK_HEADING_LEVELS[kind], content)
+
+
+def as_block(block):
+    """块节点原样返回，(块类型, 内容)元组转换为块节点"""
+    return block if isinstance(block, Block) else make_block(*block)
+
+
+def dump_blocks(blocks):
+    """把块节点列表序列化为字节（pickle）"""
+    return pickle.dumps(list(blocks), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_blocks(data):
+    """从dump_blocks的结果恢复块节点列表，不需要重新解析Markdown"""
+    return pickle.loads(data)
+
+
+# ==================== 核心转换函数 ====================
+def add_block_to_doc(doc, kind, content, use_styles=False, stats=None, spans=None):
+    """
+    把一个块写入Word文档
+    
+    参数:
+        doc: Word文档对象
+        kind: 块类型（BLOCK_*）
+        content: 块内容
+        use_styles: 是否使用公文命名样式代替直接格式
+        stats: ConversionStats，可选，记录本块的耗时和计数
+        spans: 正文、列表项已解析的行内片段（文档模型中的Paragraph.spans），可选
+    """
+    if stats is not None:
+        _add_block_with_stats(doc, kind, content, use_styles, stats, spans)
+        return
+    
+    if kind == BLOCK_TABLE:
+        add_table_to_doc(doc, content, use_styles)
+        return
+    
+    if kind == BLOCK_LIST_ITEM or kind == BLOCK_PARAGRAPH:
+        _add_body_paragraph(doc, content, use_styles, spans)
+        return
+    
+    # 标题：清理格式标记
+    add_heading_paragraph(doc, kind, content, use_styles)
+    
+    # 主标题后添加空行
+    if kind == BLOCK_TITLE:
+        doc.add_paragraph()
+
+
+def _add_block_with_stats(doc, kind, content, use_styles, stats, spans=None):
+    """add_block_to_doc的统计版本：按块类型计入对应阶段，并累加计数"""
+    stage = BLOCK_STAGES[kind]
+    started = stats.start_stage(stage)
+    
+    if kind == BLOCK_TABLE:
+        tbl = add_table_to_doc(doc, content, use_styles)
+        stats.end_stage(stage, started)
+        stats.count('blocks')
+        if tbl is not None:
+            # 每个单元格恰好一个Run
+            cells = len(tbl.tr_lst) * len(tbl.tblGrid.gridCol_lst)
+            stats.count('tables')
+            stats.count('table_cells', cells)
+            stats.count('runs', cells)
+        return
+    
+    if kind == BLOCK_LIST_ITEM or kind == BLOCK_PARAGRAPH:
+        p = _add_body_paragraph(doc, content, use_styles, spans)
+        stats.count('paragraphs')
+    else:
+        p = add_heading_paragraph(doc, kind, content, use_styles)
+        if kind == BLOCK_TITLE:
+            doc.add_paragraph()
+        stats.count('headings')
+    
+    stats.end_stage(stage, started)
+    stats.count('blocks')
+    stats.count('runs', len(p.r_lst))
+
+
+def _add_body_paragraph(doc, text, use_styles, spans=None):
+    """写入正文或列表项段落，纯文本走快速路径，返回新增的w:p元素"""
+    if is_plain_text(text):
+        return add_plain_paragraph(doc, text, use_styles)
+    para = doc.add_paragraph()
+    add_block_text(para, text, BLOCK_PARAGRAPH, use_styles, spans)
+    return para._p
+
+
+def _iter_blocks_with_stats(lines, stats):
+    """逐块分词，分词耗时计入tokenize阶段"""
+    blocks = tokenize_markdown(lines)
+    while True:
+        started = stats.start_stage(STAGE_TOKENIZE)
+        block = next(blocks, None)
+        stats.end_stage(STAGE_TOKENIZE, started)
+        if block is None:
+            return
+        yield block
+
+
+def iter_blocks(lines, stats=None):
+    """
+    块级分词，需要统计时分词耗时计入stats
+    
+    返回:
+        生成器，逐个产出(块类型, 内容)
+    """
+    if stats is None:
+        return tokenize_markdown(lines)
+    return _iter_blocks_with_stats(lines, stats)
+
+
+def build_gov_document(lines, use_styles=False, progress=None, stats=None):
+    """
+    根据Markdown文本行构建政府公文格式的Word文档对象
+    
+    参数:
+        lines: Markdown文本行，任意可迭代对象（列表、文件对象、生成器）
+        use_styles: True时段落只引用公文命名样式，不逐段逐Run写入直接格式，
+                    排版效果相同，生成更快、文件更小
+        progress: 进度回调progress(已完成块数, 总块数)，可选
+        stats: ConversionStats，可选，记录各阶段耗时和块、Run、表格计数
+    
+    返回:
+        docx.Document对象（尚未保存）
+    """
+    # 从公文基础模板创建Word文档（已设置页边距）
+    doc = new_gov_document()
+    
+    blocks = iter_blocks(lines, stats)
+    if progress is None:
+        for kind, content in blocks:
+            add_block_to_doc(doc, kind, content, use_styles, stats)
+        return doc
+    
+    # 需要汇报进度时先完成分词，以得到总块数
+    blocks = list(blocks)
+    total = len(blocks)
+    for index, (kind, content) in enumerate(blocks, 1):
+        add_block_to_doc(doc, kind, content, use_styles, stats)
+        progress(index, total)
+    
+    return doc
+
+
+def save_gov_document(doc, target, stats=None):
+    """
+    保存Word文档，需要统计时保存耗时计入save阶段并记录输出字节数
+    
+    参数:
+        doc: docx.Document对象
+        target: 文件路径或可写的二进制对象
+        stats: ConversionStats，可选
+    """
+    if stats is None:
+        doc.save(target)
+        return
+    
+    started = stats.start_stage(STAGE_SAVE)
+    doc.save(target)
+    stats.end_stage(STAGE_SAVE, started)
+    stats.finish(_output_size(target))
+
+
+def _output_size(target):
+    """已写出的字节数（文件路径或可定位的对象），无法获知时返回None"""
+    try:
+        if isinstance(target, (str, os.PathLike)):
+            return os.path.getsize(target)
+        return target.tell()
+    except (AttributeError, OSError):
+        return None
+
+
+@functools.lru_cache(maxsize=1)
+def _new_file_mode():
+    """新建文件的权限（按当前umask），临时文件替换为输出文件后与直接创建的文件一致"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+@contextlib.contextmanager
+def atomic_output(path):
+    """
+    以"先写临时文件再替换"的方式打开输出文件（二进制写入）
+    全部写完才替换目标文件：中途出错时删除临时文件，原有的输出文件保持不变，
+    打开着输出文件的阅读器也不会读到写了一半的文件
+    
+    参数:
+        path: 输出文件路径（所在目录需已存在）
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.' + path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        except FileNotFoundError:
+            os.chmod(tmp_path, _new_file_mode())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def convert_markdown_string(text, use_styles=False, stats=None):
+    """
+    将Markdown文本转换为政府公文格式的Word文档（全程在内存中完成，不产生临时文件）
+    
+    参数:
+        text: Markdown文本内容
+        use_styles: 是否使用公文命名样式代替直接格式
+        stats: ConversionStats，可选，转换完成后包含各阶段耗时和计数
+    
+    返回:
+        docx文件的字节内容
+    """
+    buffer = io.BytesIO()
+    doc = build_gov_document(iter_markdown_lines(text), use_styles, stats=stats)
+    save_gov_document(doc, buffer, stats)
+    return buffer.getvalue()
+
+
+def convert_markdown_with_stats(text, use_styles=False, on_stage_start=None, on_stage_end=None):
+    """
+    转换Markdown文本并返回性能统计
+    
+    参数:
+        text: Markdown文本内容
+        use_styles: 是否使用公文命名样式代替直接格式
+        on_stage_start: 阶段开始回调on_stage_start(阶段名)，可选
+        on_stage_end: 阶段结束回调on_stage_end(阶段名, 耗时秒数)，可选
+    
+    返回:
+        (docx文件的字节内容, ConversionStats)
+    """
+    stats = ConversionStats(on_stage_start, on_stage_end)
+    return convert_markdown_string(text, use_styles, stats), stats
+
+
+def convert_stream(reader, writer, use_styles=False, streaming=False, stats=None):
+    """
+    从可读对象逐行读取Markdown，将生成的Word文档写入可写对象
+    
+    参数:
+        reader: 可读对象（文本或二进制模式均可，二进制按UTF-8解码），如sys.stdin.buffer
+        writer: 可写的二进制对象（如BytesIO、以'wb'打开的文件、sys.stdout.buffer）
+        use_styles: 是否使用公文命名样式代替直接格式
+        streaming: 是否逐块流式写出，配合逐行读取时内存占用与文档长度无关
+        stats: ConversionStats，可选，记录各阶段耗时和计数
+    """
+    lines = iter_markdown_lines(reader)
+    if streaming:
+        write_docx_stream(lines, writer, use_styles, stats)
+    else:
+        save_gov_document(build_gov_document(lines, use_styles, stats=stats), writer, stats)
+
+
+def convert_markdown_to_gov_docx(md_path, docx_path, use_styles=False, streaming=False, stats=None,
+                                 pdf_path=None):
+    """
+    将Markdown文件转换为政府公文格式的Word文档
+    
+    参数:
+        md_path: Markdown文件路径
+        docx_path: 输出的Word文档路径
+        use_styles: 是否使用公文命名样式代替直接格式（文件更小、生成更快）
+        streaming: 是否逐块流式写出document.xml（超大文档内存占用恒定）
+        stats: ConversionStats，可选，记录各阶段耗时和计数
+        pdf_path: 可选，同时输出PDF的路径（两种输出共用一次分词，需要reportlab；此时不流式写出）
+    
+    返回:
+        成功返回True，失败返回False
+    """
+    try:
+        # 检查输入文件是否存在
+        md_file = Path(md_path)
+        if not md_file.exists():
+            print(f"❌ 错误：输入文件不存在: {md_path}")
+            return False
+        
+        output_path = Path(docx_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        if pdf_path is not None:
+            from md2gov_pdf import convert_markdown_to_docx_and_pdf
+            convert_markdown_to_docx_and_pdf(md_path, docx_path, pdf_path, use_styles, stats)
+            print("✅ 转换成功！")
+            print(f"   输入: {md_path}")
+            print(f"   输出: {docx_path}")
+            print(f"   PDF:  {pdf_path}")
+            return True
+        
+        # 逐行读取Markdown内容，不整体读入内存
+        with open(md_path, 'r', encoding='utf-8') as lines:
+            if streaming:
+                # 边解析边写出（写入临时文件，成功后才替换输出文件）
+                with atomic_output(docx_path) as f:
+                    write_docx_stream(lines, f, use_styles, stats)
+            else:
+                # 构建Word文档并保存
+                doc = build_gov_document(lines, use_styles, stats=stats)
+                save_gov_document(doc, docx_path, stats)
+        
+        print("✅ 转换成功！")
+        print(f"   输入: {md_path}")
+        print(f"   输出: {docx_path}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ 转换失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+# ==================== 文档模型与输出格式 ====================
+# 解析结果（中间文档模型）是块节点列表（见"文档模型"一节），
+# 同一份块列表可以交给任意输出格式渲染，不必为每种输出重新解析
+
+# 输出格式 -> 渲染函数 emitter(blocks, **选项)
+EMITTERS = {}
+
+# 尚未注册的内置输出格式 -> 提供它的模块（首次使用时导入，模块导入时自行注册）
+EMITTER_MODULES = {'html': 'md2gov_preview', 'text': 'md2gov_preview', 'pdf': 'md2gov_pdf'}
+
+
+def register_emitter(fmt, emitter):
+    """
+    注册输出格式
+    
+    参数:
+        fmt: 格式名（如'docx'、'html'）
+        emitter: 渲染函数emitter(blocks, **选项)，返回该格式的内容（bytes或str）；
+                 blocks中可能混有(块类型, 内容)元组，可先用as_block统一为块节点
+    
+    返回:
+        emitter本身，便于用作装饰器
+    """
+    EMITTERS[fmt] = emitter
+    return emitter
+
+
+def get_emitter(fmt):
+    """按格式名取渲染函数，内置格式的模块按需导入；不支持的格式抛出ValueError"""
+    emitter = EMITTERS.get(fmt)
+    if emitter is None and fmt in EMITTER_MODULES:
+        import importlib
+        importlib.import_module(EMITTER_MODULES[fmt])
+        emitter = EMITTERS.get(fmt)
+    if emitter is None:
+        raise ValueError(f"不支持的输出格式: {fmt}（可用: {', '.join(sorted(set(EMITTERS) | set(EMITTER_MODULES)))}）")
+    return emitter
+
+
+def parse_markdown(source, stats=None):
+    """
+    解析Markdown，得到中间文档模型
+    
+    参数:
+        source: Markdown字符串、文件对象或文本行的可迭代对象（同iter_markdown_lines）
+        stats: ConversionStats，可选，分词和行内格式解析耗时计入tokenize阶段
+    
+    返回:
+        块节点列表 [Heading/Paragraph/ListItem/Table, ...]，可用dump_blocks序列化
+    """
+    blocks = iter_blocks(iter_markdown_lines(source), stats)
+    if stats is None:
+        return [make_block(kind, content) for kind, content in blocks]
+    
+    nodes = []
+    for kind, content in blocks:
+        started = stats.start_stage(STAGE_TOKENIZE)
+        nodes.append(make_block(kind, content))
+        stats.end_stage(STAGE_TOKENIZE, started)
+    return nodes
+
+
+def render_blocks(blocks, fmt='docx', **options):
+    """
+    把中间文档模型渲染为指定格式
+    
+    参数:
+        blocks: parse_markdown的结果（也可以是(块类型, 内容)元组的列表）
+        fmt: 输出格式（'docx'、'html'、'text'、'pdf'或自行注册的格式）
+        options: 传给该格式渲染函数的选项
+    
+    返回:
+        该格式的内容：docx、pdf为bytes，html、text为str
+    """
+    return get_emitter(fmt)(blocks, **options)
+
+
+# layout_blocks产出的空行（与Word中主标题后、表格后的空段落对应）
+LAYOUT_BLANK = 'blank'
+
+
+def layout_blocks(blocks):
+    """
+    按Word输出的版面规则展开块列表，供PDF、HTML预览等不构建Word文档的输出格式共用
+    
+    参数:
+        blocks: 块节点列表（也可以是(块类型, 内容)元组）
+    
+    产出:
+        (样式键, 内容)：
+        - (BLOCK_TABLE, rows)：表格，各行已用空单元格补齐到最宽一行的列数；只有表头的表格与Word一致不输出
+        - (BLOCK_PARAGRAPH, spans)：正文和列表项，spans为行内片段
+        - (标题样式键, 文本)：标题，已清理格式标记
+        - (LAYOUT_BLANK, None)：空行（主标题后、表格后）
+    """
+    for block in map(as_block, blocks):
+        kind = block.kind
+        if kind == BLOCK_TABLE:
+            if len(block.rows) >= 2:
+                cols = max(len(row) for row in block.rows)
+                yield BLOCK_TABLE, [row + ('',) * (cols - len(row)) for row in block.rows]
+                yield LAYOUT_BLANK, None
+        elif kind == BLOCK_LIST_ITEM or kind == BLOCK_PARAGRAPH:
+            yield BLOCK_PARAGRAPH, block.spans
+        else:
+            yield kind, clean_markdown_marks(block.text)
+            if kind == BLOCK_TITLE:
+                yield LAYOUT_BLANK, None
+
+
+def markup_inline_spans(spans, tags, escape):
+    """
+    把行内片段转换为带标签的文本（PDF段落标记、HTML），保留的格式与Word输出相同
+    
+    参数:
+        spans: 行内片段（Paragraph.spans）
+        tags: ((格式标志位, 标签名), ...)，按从内到外的顺序包裹
+        escape: 文本转义函数
+    
+    返回:
+        标记文本
+    """
+    parts = []
+    for content, fmt in merge_inline_spans(spans, DOCX_INLINE_FORMATS):
+        content = escape(content)
+        for flag, tag in tags:
+            if fmt & flag:
+                content = f"<{tag}>{content}</{tag}>"
+        parts.append(content)
+    return ''.join(parts)
+
+
+def emit_docx(blocks, use_styles=False, stats=None):
+    """
+    DOCX输出：按公文格式排版块列表
+    
+    参数:
+        blocks: 块列表
+        use_styles: 是否使用公文命名样式代替直接格式
+        stats: ConversionStats，可选，记录各阶段耗时和计数
+    
+    返回:
+        docx文件的字节内容
+    """
+    doc = new_gov_document()
+    for block in map(as_block, blocks):
+        add_block_to_doc(doc, block.kind, block.content, use_styles, stats, block.spans)
+    buffer = io.BytesIO()
+    save_gov_document(doc, buffer, stats)
+    return buffer.getvalue()
+
+
+register_emitter('docx', emit_docx)
+
+
+# ==================== 流式输出 ====================
+# 正文部件名
+DOCUMENT_PART = 'word/document.xml'
+
+# 片段根元素上重复声明的命名空间（文档根元素已声明）
+XMLNS_DECLARATION_PATTERN = re.compile(r' xmlns:\w+="[^"]*"')
+
+# 基础模板拆分后的静态部件，每个进程只生成一次
+_STREAM_TEMPLATE = None
+
+
+def _stream_template():
+    """
+    拆分公文基础模板，供流式输出复用
+    
+    返回:
+        (document.xml开头直到<w:body>, 从<w:sectPr>到结尾, [(部件名, 内容), ...])
+        部件按模板中的顺序排列，document.xml的内容为None
+    """
+    global _STREAM_TEMPLATE
+    if _STREAM_TEMPLATE is None:
+        buffer = io.BytesIO()
+        new_gov_document().save(buffer)
+        with zipfile.ZipFile(buffer) as package:
+            parts = [(name, None if name == DOCUMENT_PART else package.read(name))
+                     for name in package.namelist()]
+            document_xml = package.read(DOCUMENT_PART).decode('utf-8')
+        body_start = document_xml.index('<w:body>') + len('<w:body>')
+        sect_start = document_xml.index('<w:sectPr')
+        _STREAM_TEMPLATE = (document_xml[:body_start].encode('utf-8'),
+                            document_xml[sect_start:].encode('utf-8'),
+                            parts)
+    return _STREAM_TEMPLATE
+
+
+def _serialize_body_element(element):
+    """序列化正文中的单个元素，去掉其根标签上多余的命名空间声明"""
+    xml = etree.tostring(element, encoding='unicode')
+    tag_end = xml.index('>')
+    return (XMLNS_DECLARATION_PATTERN.sub('', xml[:tag_end]) + xml[tag_end:]).encode('utf-8')
+
+
+def _take_rendered_xml(body):
+    """序列化草稿文档正文中新增的元素（sectPr之前的全部子元素），并从草稿中移除"""
+    # 最后一个子元素是sectPr，之前的都是新增的内容
+    elements = list(body)[:-1]
+    xml = b''.join(_serialize_body_element(element) for element in elements)
+    for element in elements:
+        body.remove(element)
+    return xml
+
+
+class _ChunkSink:
+    """不可定位的写入目标：收集zipfile写出的字节，供生成器逐块取出"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _write_docx_incrementally(lines, target, use_styles=False, stats=None):
+    """
+    把Markdown逐块写成docx压缩包，每写完一个块yield一次
+    
+    静态部件（styles.xml、settings.xml、fontTable.xml等）直接复用模板的字节；
+    document.xml按块生成：块先写入一个草稿文档，序列化后立即从草稿中移除，
+    因此内存占用与文档长度无关，输出与build_gov_document完全一致。
+    需要统计时，序列化和压缩写出的耗时计入save阶段。
+    """
+    head, tail, parts = _stream_template()
+    scratch = new_gov_document()
+    body = scratch.element.body
+    
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as package:
+        for name, data in parts:
+            if data is not None:
+                package.writestr(name, data)
+                continue
+            
+            with package.open(DOCUMENT_PART, 'w') as document_part:
+                document_part.write(head)
+                for kind, content in iter_blocks(lines, stats):
+                    add_block_to_doc(scratch, kind, content, use_styles, stats)
+                    started = stats.start_stage(STAGE_SAVE) if stats is not None else None
+                    document_part.write(_take_rendered_xml(body))
+                    if stats is not None:
+                        stats.end_stage(STAGE_SAVE, started)
+                    yield
+                document_part.write(tail)
+    
+    if stats is not None:
+        stats.finish(_output_size(target))
+
+
+def iter_docx_chunks(lines, use_styles=False, stats=None):
+    """
+    流式生成docx文件内容，边解析边输出
+    
+    参数:
+        lines: Markdown文本行
+        use_styles: 是否使用公文命名样式代替直接格式
+        stats: ConversionStats，可选，生成器结束后包含各阶段耗时和计数
+    
+    返回:
+        生成器，逐块产出docx文件的字节，可直接作为HTTP流式响应体
+    """
+    sink = _ChunkSink()
+    size = 0
+    for _ in _write_docx_incrementally(lines, sink, use_styles, stats):
+        data = sink.drain()
+        if data:
+            size += len(data)
+            yield data
+    data = sink.drain()
+    if data:
+        size += len(data)
+        yield data
+    
+    if stats is not None:
+        stats.finish(size)
+
+
+def write_docx_stream(lines, writer, use_styles=False, stats=None):
+    """
+    流式把Markdown转换为docx并写入可写对象，内存占用不随文档长度增长
+    
+    参数:
+        lines: Markdown文本行
+        writer: 可写的二进制对象（文件、BytesIO等）
+        use_styles: 是否使用公文命名样式代替直接格式
+        stats: ConversionStats，可选，记录各阶段耗时和计数
+    """
+    for _ in _write_docx_incrementally(lines, writer, use_styles, stats):
+        pass
+
+
+# ==================== 增量转换 ====================
+# 增量转换默认缓存的块片段数
+DEFAULT_FRAGMENT_CACHE_SIZE = 20000
+
+
+class IncrementalConverter:
+    """
+    增量转换：缓存每个块渲染后的document.xml片段
+    
+    片段按(是否使用命名样式, 块类型, 块内容)缓存。块类型已包含格式上下文
+    （例如第一个#标题是主标题，之后的#行按正文处理），相同的键总是渲染出相同的XML。
+    再次转换修改过的文档时只渲染变化的块，其余直接拼接缓存中的片段，
+    输出的document.xml与build_gov_document完全一致。
+    
+    线程安全，可在同一用户的多次转换之间复用（如Streamlit会话）。
+    """
+    
+    def __init__(self, max_fragments=DEFAULT_FRAGMENT_CACHE_SIZE):
+        """
+        参数:
+            max_fragments: 最多缓存的块片段数，超出时淘汰最久未使用的
+        """
+        self.max_fragments = max_fragments
+        self._fragments = OrderedDict()
+        self._scratch = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def convert(self, text, use_styles=False, stats=None):
+        """
+        转换Markdown文本，用法同convert_markdown_string
+        
+        参数:
+            text: Markdown文本内容（或任意文本行的可迭代对象）
+            use_styles: 是否使用公文命名样式代替直接格式
+            stats: ConversionStats，可选，只统计本次实际渲染的块
+        
+        返回:
+            docx文件的字节内容
+        """
+        return self.convert_blocks(iter_blocks(iter_markdown_lines(text), stats), use_styles, stats)
+    
+    def convert_blocks(self, blocks, use_styles=False, stats=None):
+        """
+        转换已解析的块列表（parse_markdown的结果或(块类型, 内容)的可迭代对象），
+        同一份块列表还可以交给其他输出格式，不必重新解析
+        
+        返回:
+            docx文件的字节内容
+        """
+        head, tail, parts = _stream_template()
+        
+        with self._lock:
+            pieces = [head]
+            for kind, content in blocks:
+                pieces.append(self._render(kind, content, use_styles, stats))
+            pieces.append(tail)
+        
+        started = stats.start_stage(STAGE_SAVE) if stats is not None else None
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as package:
+            for name, data in parts:
+                package.writestr(name, data if data is not None else b''.join(pieces))
+        if stats is not None:
+            stats.end_stage(STAGE_SAVE, started)
+            stats.finish(buffer.tell())
+        return buffer.getvalue()
+    
+    def stats(self):
+        """返回片段缓存的命中统计"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'fragments': len(self._fragments)}
+    
+    def _render(self, kind, content, use_styles, stats):
+        """返回块的XML片段，缓存未命中时在草稿文档中渲染（调用方需持有锁）"""
+        key = (use_styles, kind, tuple(map(tuple, content)) if kind == BLOCK_TABLE else content)
+        fragment = self._fragments.get(key)
+        if fragment is not None:
+            self._fragments.move_to_end(key)
+            self.hits += 1
+            return fragment
+        
+        if self._scratch is None:
+            self._scratch = new_gov_document()
+        add_block_to_doc(self._scratch, kind, content, use_styles, stats)
+        fragment = _take_rendered_xml(self._scratch.element.body)
+        
+        self.misses += 1
+        self._fragments[key] = fragment
+        if len(self._fragments) > self.max_fragments:
+            self._fragments.popitem(last=False)
+        return fragment
+
+
+# ==================== 批量转换 ====================
+# 批量模式下识别的Markdown文件后缀
+MARKDOWN_SUFFIXES = ('.md', '.markdown')
+
+# 批量打包时记录失败文件的清单名
+BATCH_ERROR_REPORT = '转换失败清单.txt'
+
+# 打包下载时每个转换线程最多排队的文档数（限制同时驻留内存的转换结果）
+BATCH_IN_FLIGHT_PER_WORKER = 2
+
+# 批量转换持久缓存所在的子目录（位于cache_dir()下）
+BATCH_CACHE_NAME = 'batch'
+
+
+def find_markdown_files(in_dir):
+    """
+    递归查找目录下的Markdown文件
+    
+    返回: 按路径排序的Path列表
+    """
+    return sorted(path for path in Path(in_dir).rglob('*')
+                  if path.suffix.lower() in MARKDOWN_SUFFIXES and path.is_file())
+
+
+def _convert_file_job(task):
+    """
+    批量模式的单文件转换任务（在工作进程中执行）
+    
+    参数:
+        task: (输入路径, 输出路径, 是否使用命名样式, PDF输出路径或None)
+    
+    返回:
+        (输入路径, 错误信息或None, 输入字节数)
+    """
+    md_path, docx_path, use_styles, pdf_path = task
+    try:
+        size = os.path.getsize(md_path)
+        
+        Path(docx_path).parent.mkdir(parents=True, exist_ok=True)
+        if pdf_path is not None:
+            from md2gov_pdf import convert_markdown_to_docx_and_pdf
+            convert_markdown_to_docx_and_pdf(md_path, docx_path, pdf_path, use_styles)
+            return md_path, None, size
+        
+        with open(md_path, 'r', encoding='utf-8') as f:
+            doc = build_gov_document(f, use_styles)
+        doc.save(docx_path)
+        return md_path, None, size
+    except Exception as e:
+        return md_path, f"{type(e).__name__}: {e}", 0
+
+
+def convert_directory(in_dir, out_dir, jobs=None, use_styles=False, pdf=False, cache=None):
+    """
+    批量转换目录下的所有Markdown文件，保持目录结构
+    
+    单个文件失败不会中断批量任务，所有错误汇总在返回结果中。
+    
+    参数:
+        in_dir: 输入目录
+        out_dir: 输出目录（按输入目录的相对路径生成.docx）
+        jobs: 并行进程数，默认为CPU核数；1表示在当前进程中顺序转换
+        use_styles: 是否使用公文命名样式代替直接格式
+        pdf: 是否同时在.docx旁输出同名的.pdf
+        cache: conversion_cache.BatchCache，可选；未改动的文件直接跳过或从缓存写出，
+               其余文件转换成功后存入缓存，结束时写回缓存索引
+    
+    返回:
+        汇总字典: {'total', 'succeeded', 'failed', 'cached', 'input_bytes', 'elapsed',
+                   'errors': [(路径, 错误信息), ...]}
+    """
+    in_root = Path(in_dir)
+    out_root = Path(out_dir)
+    tasks = []
+    for path in find_markdown_files(in_root):
+        docx_path = out_root / path.relative_to(in_root).with_suffix('.docx')
+        tasks.append((str(path), str(docx_path), use_styles, str(docx_path.with_suffix('.pdf')) if pdf else None))
+    
+    jobs = jobs or os.cpu_count() or 1
+    summary = {'total': len(tasks), 'succeeded': 0, 'failed': 0, 'cached': 0,
+               'input_bytes': 0, 'elapsed': 0.0, 'errors': []}
+    
+    start = time.perf_counter()
+    on_success = None
+    if cache is not None:
+        # 在主进程中逐个检查缓存，只把需要转换的文件分发给工作进程
+        pending = []
+        for task in tasks:
+            size = cache.restore(task[0], _task_outputs(task), use_styles)
+            if size is None:
+                pending.append(task)
+            else:
+                summary['succeeded'] += 1
+                summary['cached'] += 1
+                summary['input_bytes'] += size
+        tasks = pending
+        outputs = {task[0]: _task_outputs(task) for task in tasks}
+        on_success = functools.partial(_store_batch_outputs, cache, outputs, use_styles)
+    
+    if jobs == 1 or len(tasks) <= 1:
+        results = map(_convert_file_job, tasks)
+        _collect_batch_results(results, summary, on_success)
+    else:
+        # 小文件数量多时按块分发，减少进程间通信次数
+        chunksize = max(1, min(64, len(tasks) // (jobs * 4)))
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(_convert_file_job, tasks, chunksize=chunksize)
+            _collect_batch_results(results, summary, on_success)
+    
+    if cache is not None:
+        cache.save()
+    summary['elapsed'] = time.perf_counter() - start
+    
+    return summary
+
+
+def _store_batch_outputs(cache, outputs, use_styles, md_path):
+    """批量转换成功后把该文件的输出存入持久缓存（outputs: 输入路径 -> {输出格式: 路径}）"""
+    cache.store_outputs(md_path, outputs[md_path], use_styles)
+
+
+def _task_outputs(task):
+    """批量任务的输出文件 {输出格式: 路径}"""
+    _, docx_path, _, pdf_path = task
+    if pdf_path is None:
+        return {'docx': docx_path}
+    return {'docx': docx_path, 'pdf': pdf_path}
+
+
+def _collect_batch_results(results, summary, on_success=None):
+    """汇总批量转换结果，失败的文件即时输出；on_success(输入路径)在每个文件转换成功后调用"""
+    for md_path, error, size in results:
+        if error is None:
+            summary['succeeded'] += 1
+            summary['input_bytes'] += size
+            if on_success is not None:
+                on_success(md_path)
+        else:
+            summary['failed'] += 1
+            summary['errors'].append((md_path, error))
+            print(f"❌ 转换失败: {md_path}: {error}")
+
+
+def print_batch_summary(summary):
+    """输出批量转换的吞吐量和失败汇总"""
+    elapsed = summary['elapsed']
+    files_per_second = summary['total'] / elapsed if elapsed > 0 else 0.0
+    kb_per_second = summary['input_bytes'] / 1024 / elapsed if elapsed > 0 else 0.0
+    
+    print("\n" + "="*60)
+    print("批量转换完成")
+    print("="*60)
+    print(f"  文件总数: {summary['total']}")
+    print(f"  成功: {summary['succeeded']}")
+    print(f"  失败: {summary['failed']}")
+    if summary.get('cached'):
+        print(f"  未改动（取自缓存）: {summary['cached']}")
+    print(f"  耗时: {elapsed:.2f} 秒")
+    print(f"  吞吐量: {files_per_second:.1f} 个/秒，{kb_per_second:.1f} KB/秒")
+    if summary['errors']:
+        print("\n失败文件:")
+        for md_path, error in summary['errors']:
+            print(f"  {md_path}: {error}")
+    print("="*60 + "\n")
+
+
+def _batch_output_names(names):
+    """
+    由上传文件名生成压缩包内的docx文件名：去掉目录和后缀，重名时追加序号
+    
+    返回: 与names一一对应的文件名列表
+    """
+    used = set()
+    result = []
+    for name in names:
+        stem = Path(name.replace('\\', '/')).stem or '公文格式文档'
+        candidate = f"{stem}.docx"
+        index = 2
+        while candidate in used:
+            candidate = f"{stem}({index}).docx"
+            index += 1
+        used.add(candidate)
+        result.append(candidate)
+    return result
+
+
+def iter_batch_zip(documents, use_styles=False, converter=None, max_workers=None, progress=None):
+    """
+    并行转换多篇Markdown，边转换边输出一个ZIP压缩包
+    每篇文档转换完成后立即写入压缩包并产出对应的字节，随即释放其结果，不等待全部完成、也不缓存全部结果；
+    同时转换或等待写入的文档不超过线程数的BATCH_IN_FLIGHT_PER_WORKER倍
+    
+    参数:
+        documents: [(文件名, Markdown文本), ...]
+        use_styles: 是否使用公文命名样式代替直接格式
+        converter: 转换函数converter(text, use_styles, stats)，默认convert_markdown_string，
+                   可换成带缓存或交给进程池的版本
+        max_workers: 并行转换的线程数，默认为CPU核数
+        progress: 进度回调progress(已完成篇数, 总篇数, 文件名, 错误信息或None)，可选
+    
+    返回:
+        生成器，逐块产出ZIP文件的字节；失败的文档记录在压缩包内的转换失败清单中
+    """
+    documents = list(documents)
+    total = len(documents)
+    convert = converter or convert_markdown_string
+    output_names = _batch_output_names([name for name, _ in documents])
+    
+    sink = _ChunkSink()
+    failures = []
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    workers = max_workers or min(total, os.cpu_count() or 1) or 1
+    executor = ThreadPoolExecutor(max_workers=workers)
+    queued = zip(documents, output_names)
+    in_flight = {}  # 已提交的转换 -> (文件名, 压缩包内文件名)
+    
+    def submit(count):
+        for (name, text), output_name in itertools.islice(queued, count):
+            in_flight[executor.submit(convert, text, use_styles, None)] = (name, output_name)
+    
+    try:
+        # 只保持有限篇文档在转换或等待写入，每篇写入压缩包后即释放其结果
+        submit(workers * BATCH_IN_FLIGHT_PER_WORKER)
+        done = 0
+        
+        # docx本身已压缩，压缩包内直接存储
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, output_name = in_flight.pop(future)
+                    try:
+                        archive.writestr(output_name, future.result())
+                        error = None
+                    except Exception as e:
+                        error = f"{type(e).__name__}: {e}"
+                        failures.append((name, error))
+                    submit(1)
+                    
+                    done += 1
+                    if progress is not None:
+                        progress(done, total, name, error)
+                    data = sink.drain()
+                    if data:
+                        yield data
+                finished = future = None
+            
+            if failures:
+                report = '\n'.join(f"{name}: {error}" for name, error in failures)
+                archive.writestr(BATCH_ERROR_REPORT, report + '\n')
+    finally:
+        # 客户端中途断开时不再启动排队中的转换
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def write_batch_zip(documents, writer, use_styles=False, converter=None, max_workers=None, progress=None):
+    """
+    并行转换多篇Markdown，打包写入可写对象，参数同iter_batch_zip
+    
+    返回:
+        失败的文档数
+    """
+    failures = 0
+    
+    def track(done, total, name, error):
+        nonlocal failures
+        if error is not None:
+            failures += 1
+        if progress is not None:
+            progress(done, total, name, error)
+    
+    for data in iter_batch_zip(documents, use_styles, converter, max_workers, track):
+        writer.write(data)
+    return failures
+
+
+# ==================== 命令行入口 ====================
+# 用法说明、常驻转换进程及其客户端在md2gov_cli中，不依赖python-docx
+def convert_stdio(input_path, output_path, use_styles=False, stats=None):
+    """
+    支持标准输入/标准输出的转换，路径为"-"时使用对应的标准流
+    输出写到标准输出时提示信息改写到标准错误，避免混入文档内容
+    
+    返回:
+        成功返回True，失败返回False
+    """
+    try:
+        with contextlib.ExitStack() as stack:
+            reader = sys.stdin.buffer if input_path == STDIO_PATH else stack.enter_context(open(input_path, 'rb'))
+            # 输出到文件时先写临时文件，转换失败不会留下残缺的.docx
+            writer = sys.stdout.buffer if output_path == STDIO_PATH else stack.enter_context(atomic_output(output_path))
+            # 逐行读取、逐块写出，可用于管道中处理任意长度的文档
+            convert_stream(reader, writer, use_styles, streaming=True, stats=stats)
+            writer.flush()
+    except Exception as e:
+        print(f"❌ 转换失败: {e}", file=sys.stderr)
+        return False
+    
+    if output_path != STDIO_PATH:
+        print(f"✅ 转换成功！输出: {output_path}")
+    return True
+
+
+def build_arg_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(
+        prog=Path(__file__).name,
+        description='Markdown转政府公文格式Word文档工具'
+    )
+    parser.add_argument('input', nargs='?', help='输入.md文件，"-"表示标准输入（批量模式下为输入目录）')
+    parser.add_argument('output', nargs='?', help='输出.docx文件，"-"表示标准输出（批量模式下为输出目录）')
+    parser.add_argument('--styles', action='store_true',
+                        help='使用公文命名样式代替直接格式，文件更小、生成更快')
+    parser.add_argument('--stream', action='store_true',
+                        help='逐块流式写出document.xml，超大文档内存占用恒定')
+    parser.add_argument('--batch', action='store_true',
+                        help='批量转换输入目录下的所有.md文件，保持目录结构')
+    parser.add_argument('--profile', action='store_true',
+                        help='输出各阶段耗时和块、Run、表格计数（单文件模式）')
+    parser.add_argument('--jobs', type=int, default=None, metavar='N',
+                        help='批量模式的并行进程数（默认为CPU核数）')
+    parser.add_argument('--pdf', action='store_true',
+                        help='同时在输出文件旁生成同名PDF（需要reportlab）')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='批量模式不使用持久缓存，所有文件都重新转换')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='批量模式清空持久缓存后全部重新转换，并写入新的缓存')
+    parser.add_argument('--cache-size', type=int, default=None, metavar='MB',
+                        help='批量模式持久缓存的容量上限（MB，默认512），超出时淘汰最久未使用的条目')
+    parser.add_argument('--watch', action='store_true',
+                        help='监视输入文件（批量模式下为输入目录），保存后自动重新转换变化的文件')
+    parser.add_argument('--poll', action='store_true',
+                        help='监视模式不使用文件事件，定时检查文件状态（网络文件系统等事件不可靠时使用）')
+    parser.add_argument('--debounce', type=float, default=None, metavar='SECONDS',
+                        help='监视模式在最后一次文件变化后等待多久再转换（默认0.3秒）')
+    parser.add_argument('--daemon', action='store_true',
+                        help='在后台启动常驻转换进程，之后的单文件转换自动交给它执行')
+    parser.add_argument('--server', action='store_true',
+                        help='在前台运行常驻转换进程')
+    parser.add_argument('--stop-server', action='store_true', help='停止常驻转换进程')
+    parser.add_argument('--socket', metavar='PATH', help='常驻转换进程的套接字路径')
+    parser.add_argument('--no-daemon', action='store_true',
+                        help='不使用常驻转换进程，在当前进程中转换')
+    return parser
+
+
+def run_cli(argv=None):
+    """
+    执行一次转换命令（单文件或批量），返回退出码
+    常驻转换进程对每个客户端请求调用一次
+    
+    参数:
+        argv: 命令行参数（不含脚本名），默认取sys.argv
+    """
+    args = build_arg_parser().parse_args(argv)
+    
+    if args.input is None or args.output is None:
+        print_usage()
+        return 1
+    
+    if args.watch:
+        return run_watch(args)
+    
+    if args.batch:
+        if not Path(args.input).is_dir():
+            print(f"❌ 错误：输入目录不存在: {args.input}")
+            return 1
+        cache = None
+        if not args.no_cache:
+            from conversion_cache import BatchCache, DEFAULT_DISK_BYTES
+            max_bytes = args.cache_size * 1024 * 1024 if args.cache_size is not None else DEFAULT_DISK_BYTES
+            cache = BatchCache(Path(cache_dir()) / BATCH_CACHE_NAME, max_bytes, rebuild=args.rebuild_cache)
+        summary = convert_directory(args.input, args.output, args.jobs, args.styles, args.pdf, cache)
+        print_batch_summary(summary)
+        return 0 if summary['failed'] == 0 else 1
+    
+    stats = ConversionStats() if args.profile else None
+    if STDIO_PATH in (args.input, args.output):
+        if args.pdf:
+            print("❌ 错误：--pdf 不支持标准输入/标准输出", file=sys.stderr)
+            return 1
+        success = convert_stdio(args.input, args.output, args.styles, stats)
+    else:
+        pdf_path = str(Path(args.output).with_suffix('.pdf')) if args.pdf else None
+        success = convert_markdown_to_gov_docx(args.input, args.output, args.styles, args.stream, stats, pdf_path)
+    
+    if success and stats is not None:
+        # 输出写到标准输出时，统计信息改写到标准错误
+        stream = sys.stderr if args.output == STDIO_PATH else sys.stdout
+        print("📊 各阶段耗时:", file=stream)
+        print(stats.summary(), file=stream)
+    return 0 if success else 1
+
+
+def run_watch(args):
+    """监视模式：检查参数后常驻运行，直到按Ctrl+C"""
+    if STDIO_PATH in (args.input, args.output):
+        print("❌ 错误：--watch 不支持标准输入/标准输出", file=sys.stderr)
+        return 1
+    if args.batch and not Path(args.input).is_dir():
+        print(f"❌ 错误：输入目录不存在: {args.input}")
+        return 1
+    if not args.batch and not Path(args.input).is_file():
+        print(f"❌ 错误：输入文件不存在: {args.input}")
+        return 1
+    
+    from md2gov_watch import DEFAULT_DEBOUNCE, WatchTarget, watch
+    target = WatchTarget(args.input, args.output, directory=args.batch, pdf=args.pdf)
+    debounce = args.debounce if args.debounce is not None else DEFAULT_DEBOUNCE
+    return watch([target], args.styles, debounce, use_events=not args.poll)
+
+
+def main():
+    """命令行主函数"""
+    args = build_arg_parser().parse_args()
+    
+    if args.server:
+        # 常驻转换进程：预先构建公文基础模板和流式输出模板，之后每次转换只做排版
+        sys.exit(serve(args.socket, run_cli, warm_up=_stream_template))
+    if args.daemon:
+        sys.exit(start_daemon(args.socket))
+    if args.stop_server:
+        sys.exit(stop_daemon(args.socket))
+    
+    sys.exit(run_cli())
 
 
 if __name__ == '__main__':
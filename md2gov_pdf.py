@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown转政府公文格式 - PDF输出
+直接由块流（tokenize_markdown的结果）排版生成PDF，与Word文档共用字体、字号、行距、页边距常量，
+不经过Word/LibreOffice等外部转换。一次分词的块列表可以同时生成Word文档和PDF。
+
+依赖reportlab（可选，仅PDF输出需要）。字体按名称在系统字体目录中查找TrueType文件，
+每个进程只解析一次，保存时只嵌入用到的字形；找不到时退回reportlab内置的宋体（STSong-Light，不嵌入）。
+"""
+
+import functools
+import io
+import os
+import sys
+import threading
+from xml.sax.saxutils import escape
+
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT, TA_RIGHT
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+except ImportError:  # 未安装reportlab时只影响PDF输出
+    pdfmetrics = None
+
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from md2gov_docx import (GOV_STYLES, LINE_SPACING_28_8,
+                         MARGIN_TOP, MARGIN_BOTTOM, MARGIN_LEFT, MARGIN_RIGHT,
+                         FONT_FANGSONG_GB2312, FONT_KAITI_GB2312, FONT_HEITI, FONT_XIAOBIAOSONG,
+                         BLOCK_PARAGRAPH, BLOCK_TABLE, LAYOUT_BLANK,
+                         INLINE_BOLD, INLINE_ITALIC, INLINE_STRIKE,
+                         add_block_to_doc, layout_blocks, markup_inline_spans, new_gov_document,
+                         parse_markdown, register_emitter, resolved_paragraph_format, save_gov_document)
+
+# ==================== 字体 ====================
+# 字体名 -> 可能的字体文件名（不区分大小写，按顺序查找）
+FONT_FILES = {
+    FONT_FANGSONG_GB2312: ('仿宋_GB2312.ttf', 'FangSong_GB2312.ttf', 'simfang.ttf', 'STFANGSO.TTF', 'Fangsong.ttf'),
+    FONT_KAITI_GB2312: ('楷体_GB2312.ttf', 'KaiTi_GB2312.ttf', 'simkai.ttf', 'STKAITI.TTF', 'Kaiti.ttf'),
+    FONT_HEITI: ('黑体.ttf', 'SimHei.ttf', 'STHEITI.TTF', 'Heiti.ttf'),
+    FONT_XIAOBIAOSONG: ('方正小标宋简体.ttf', '方正小标宋_GBK.ttf', 'FZXBSJW.TTF', 'FZXBSK.TTF'),
+}
+
+# 额外的字体目录（多个目录用os.pathsep分隔），优先于系统字体目录
+FONT_DIR_ENV = 'MD2GOV_FONT_DIR'
+SYSTEM_FONT_DIRS = (
+    '~/.fonts', '~/.local/share/fonts', '/usr/share/fonts', '/usr/local/share/fonts',
+    '~/Library/Fonts', '/Library/Fonts', '/System/Library/Fonts', r'C:\Windows\Fonts',
+)
+
+# 找不到字体文件时使用的reportlab内置中文字体（阅读器自带，不嵌入）
+FALLBACK_FONT = 'STSong-Light'
+
+# 字体名 -> 已注册的reportlab字体名；TrueType字体解析一次后在进程内复用，
+# reportlab为每个文档单独记录用到的字形，保存时只嵌入这些字形的子集
+_PDF_FONTS = {}
+_PDF_FONTS_LOCK = threading.Lock()
+
+# 段落对齐方式（Word -> reportlab）
+PDF_ALIGNMENTS = {}
+if pdfmetrics is not None:
+    PDF_ALIGNMENTS.update({
+        WD_ALIGN_PARAGRAPH.LEFT: TA_LEFT,
+        WD_ALIGN_PARAGRAPH.CENTER: TA_CENTER,
+        WD_ALIGN_PARAGRAPH.RIGHT: TA_RIGHT,
+        WD_ALIGN_PARAGRAPH.JUSTIFY: TA_JUSTIFY,
+        WD_ALIGN_PARAGRAPH.JUSTIFY_LOW: TA_JUSTIFY,
+    })
+
+# 行内格式 -> reportlab段落标记（从内到外）
+PDF_INLINE_TAGS = ((INLINE_STRIKE, 'strike'), (INLINE_ITALIC, 'i'), (INLINE_BOLD, 'b'))
+
+# 表格单元格行距（单倍行距，按字号的倍数）
+TABLE_LEADING_RATIO = 1.2
+TABLE_GRID_WIDTH = 0.5
+
+
+def _require_reportlab():
+    if pdfmetrics is None:
+        raise RuntimeError('PDF输出需要reportlab，请先安装：pip install reportlab')
+
+
+@functools.lru_cache(maxsize=1)
+def _font_file_index():
+    """扫描字体目录，返回 小写文件名 -> 路径（每个进程只扫描一次）"""
+    dirs = [d for d in os.environ.get(FONT_DIR_ENV, '').split(os.pathsep) if d]
+    dirs.extend(SYSTEM_FONT_DIRS)
+
+    index = {}
+    for font_dir in dirs:
+        font_dir = os.path.expanduser(font_dir)
+        for root, _, files in os.walk(font_dir):
+            for name in files:
+                index.setdefault(name.lower(), os.path.join(root, name))
+    return index
+
+
+def find_font_file(font_name):
+    """查找字体对应的TrueType文件，找不到时返回None"""
+    index = _font_file_index()
+    for file_name in FONT_FILES.get(font_name, ()):
+        path = index.get(file_name.lower())
+        if path is not None:
+            return path
+    return None
+
+
+def register_pdf_font(font_name):
+    """
+    注册字体并返回reportlab字体名（每个进程只解析一次字体文件）
+
+    参数:
+        font_name: 公文字体名（FONT_*）
+
+    返回:
+        reportlab字体名；找不到字体文件或文件无法解析时为FALLBACK_FONT
+    """
+    _require_reportlab()
+    registered = _PDF_FONTS.get(font_name)
+    if registered is not None:
+        return registered
+
+    with _PDF_FONTS_LOCK:
+        registered = _PDF_FONTS.get(font_name)
+        if registered is None:
+            registered = FALLBACK_FONT
+            path = find_font_file(font_name)
+            if path is not None:
+                try:
+                    pdfmetrics.registerFont(TTFont(font_name, path, subfontIndex=0))
+                    registered = font_name
+                except Exception as e:
+                    print(f"⚠️ 字体文件无法使用，改用内置宋体: {path} ({e})", file=sys.stderr)
+            if registered == FALLBACK_FONT and FALLBACK_FONT not in pdfmetrics.getRegisteredFontNames():
+                pdfmetrics.registerFont(UnicodeCIDFont(FALLBACK_FONT))
+            _PDF_FONTS[font_name] = registered
+    return registered
+
+
+# ==================== 段落样式 ====================
+@functools.lru_cache(maxsize=None)
+def pdf_paragraph_style(style_key):
+    """
+    按公文样式表（GOV_STYLES）生成PDF段落样式，与Word中的直接格式一致
+
+    参数:
+        style_key: GOV_STYLES中的样式键
+    """
+    _, style_id, font_name, font_size, _, _ = GOV_STYLES[style_key]
+    p_format = resolved_paragraph_format(style_key)
+    size = font_size.pt
+    line_spacing = p_format['line_spacing']
+    space_before = p_format['space_before']
+    space_after = p_format['space_after']
+    return ParagraphStyle(
+        style_id,
+        fontName=register_pdf_font(font_name),
+        fontSize=size,
+        # 固定行距；未指定时为单倍行距
+        leading=line_spacing.pt if line_spacing is not None else size * TABLE_LEADING_RATIO,
+        firstLineIndent=p_format['indent'].pt if p_format['indent'] is not None else 0,
+        alignment=PDF_ALIGNMENTS[p_format['alignment']],
+        spaceBefore=space_before.pt if space_before is not None else 0,
+        spaceAfter=space_after.pt if space_after is not None else 0,
+        wordWrap='CJK',
+    )
+
+
+def inline_markup(spans):
+    """
+    把正文的行内片段（Paragraph.spans）转换为reportlab段落标记（<b>、<i>、<strike>），规则与Word输出相同
+    中文字体通常没有粗体、斜体字形，此时按常规字形显示
+    """
+    return markup_inline_spans(spans, PDF_INLINE_TAGS, escape)
+
+
+@functools.lru_cache(maxsize=1)
+def _page_size():
+    """页面尺寸（磅），与Word文档的基础模板一致"""
+    section = new_gov_document().sections[0]
+    return section.page_width.pt, section.page_height.pt
+
+
+# ==================== 块排版 ====================
+def _table_flowable(table_data, frame_width):
+    """表格（各行列数相同）：列宽平均分配版心宽度，表头黑体加粗，单元格居中，网格线"""
+    cols = len(table_data[0])
+    header_style = pdf_paragraph_style('table_header')
+    cell_style = pdf_paragraph_style('table_cell')
+
+    rows = []
+    for i, row in enumerate(table_data):
+        style = header_style if i == 0 else cell_style
+        rows.append([Paragraph(escape(text), style) for text in row])
+
+    table = Table(rows, colWidths=[frame_width / cols] * cols)
+    table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), TABLE_GRID_WIDTH, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+    return table
+
+
+def build_pdf_flowables(blocks, frame_width):
+    """
+    把块流转换为reportlab的排版元素
+
+    参数:
+        blocks: 块节点列表（parse_markdown的结果），也可以是(块类型, 内容)的可迭代对象
+        frame_width: 版心宽度（磅）
+
+    返回:
+        排版元素列表
+    """
+    blank_line = LINE_SPACING_28_8.pt
+    flowables = []
+    for style_key, content in layout_blocks(blocks):
+        if style_key == LAYOUT_BLANK:
+            flowables.append(Spacer(0, blank_line))
+        elif style_key == BLOCK_TABLE:
+            flowables.append(_table_flowable(content, frame_width))
+        elif style_key == BLOCK_PARAGRAPH:
+            flowables.append(Paragraph(inline_markup(content), pdf_paragraph_style(BLOCK_PARAGRAPH)))
+        else:
+            flowables.append(Paragraph(escape(content), pdf_paragraph_style(style_key)))
+    return flowables
+
+
+def write_gov_pdf(blocks, target):
+    """
+    按公文格式把块流排版为PDF
+
+    参数:
+        blocks: 块节点列表（parse_markdown的结果），也可以是(块类型, 内容)的可迭代对象
+        target: 文件路径或可写的二进制文件对象
+    """
+    _require_reportlab()
+    page_width, page_height = _page_size()
+    pdf = SimpleDocTemplate(
+        target,
+        pagesize=(page_width, page_height),
+        topMargin=MARGIN_TOP.pt,
+        bottomMargin=MARGIN_BOTTOM.pt,
+        leftMargin=MARGIN_LEFT.pt,
+        rightMargin=MARGIN_RIGHT.pt,
+    )
+    pdf.build(build_pdf_flowables(blocks, pdf.width))
+
+
+def emit_pdf(blocks, **options):
+    """
+    PDF输出格式：返回PDF文件的字节内容
+
+    参数:
+        blocks: 块节点列表
+        options: 其他输出格式的选项（如use_styles、stats），对PDF排版没有影响，忽略
+    """
+    buffer = io.BytesIO()
+    write_gov_pdf(blocks, buffer)
+    return buffer.getvalue()
+
+
+register_emitter('pdf', emit_pdf)
+
+
+# ==================== 对外接口 ====================
+def convert_markdown_to_pdf(md_path, pdf_path):
+    """
+    将Markdown文件转换为公文格式的PDF
+
+    参数:
+        md_path: Markdown文件路径
+        pdf_path: 输出的PDF路径
+    """
+    with open(md_path, 'r', encoding='utf-8') as lines:
+        write_gov_pdf(parse_markdown(lines), pdf_path)
+
+
+def convert_markdown_to_docx_and_pdf(md_path, docx_path, pdf_path, use_styles=False, stats=None):
+    """
+    同时生成Word文档和PDF：Markdown只读取、分词一次，两种输出共用同一份块列表
+
+    参数:
+        md_path: Markdown文件路径
+        docx_path: 输出的Word文档路径
+        pdf_path: 输出的PDF路径
+        use_styles: Word文档是否使用公文命名样式代替直接格式
+        stats: ConversionStats，可选，记录Word文档各阶段的耗时和计数
+    """
+    with open(md_path, 'r', encoding='utf-8') as lines:
+        blocks = parse_markdown(lines, stats)
+
+    doc = new_gov_document()
+    for block in blocks:
+        add_block_to_doc(doc, block.kind, block.content, use_styles, stats, block.spans)
+    save_gov_document(doc, docx_path, stats)
+
+    write_gov_pdf(blocks, pdf_path)
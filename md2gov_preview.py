@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown转政府公文格式 - HTML预览与纯文本输出
+由块节点列表（parse_markdown的结果）直接生成，不构建Word文档：字体、字号、行距、缩进、页边距
+取自同一张公文样式表，预览效果与Word输出一致，生成耗时只有完整转换的一小部分。
+导入本模块时注册'html'和'text'两种输出格式。
+"""
+
+import functools
+from html import escape
+
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from md2gov_docx import (GOV_STYLES, LINE_SPACING_28_8,
+                         MARGIN_TOP, MARGIN_BOTTOM, MARGIN_LEFT, MARGIN_RIGHT,
+                         FONT_FANGSONG_GB2312, FONT_KAITI_GB2312, FONT_HEITI, FONT_XIAOBIAOSONG,
+                         BLOCK_PARAGRAPH, BLOCK_TABLE, LAYOUT_BLANK,
+                         INLINE_BOLD, INLINE_ITALIC, INLINE_STRIKE,
+                         layout_blocks, markup_inline_spans, new_gov_document,
+                         parse_markdown, register_emitter, resolved_paragraph_format)
+
+# ==================== 样式 ====================
+# 公文字体 -> 浏览器中的备选字体（未安装公文字体时使用系统自带的同类字体）
+CSS_FONT_FALLBACKS = {
+    FONT_FANGSONG_GB2312: 'FangSong, STFangsong, "Noto Serif CJK SC", serif',
+    FONT_KAITI_GB2312: 'KaiTi, STKaiti, "Noto Serif CJK SC", serif',
+    FONT_HEITI: 'SimHei, STHeiti, "Noto Sans CJK SC", sans-serif',
+    FONT_XIAOBIAOSONG: 'SimSun, STSong, "Noto Serif CJK SC", serif',
+}
+
+# 段落对齐方式（Word -> CSS）
+CSS_ALIGNMENTS = {
+    WD_ALIGN_PARAGRAPH.LEFT: 'left',
+    WD_ALIGN_PARAGRAPH.CENTER: 'center',
+    WD_ALIGN_PARAGRAPH.RIGHT: 'right',
+    WD_ALIGN_PARAGRAPH.JUSTIFY: 'justify',
+    WD_ALIGN_PARAGRAPH.JUSTIFY_LOW: 'justify',
+}
+
+# 行内格式 -> HTML标签（从内到外）
+HTML_INLINE_TAGS = ((INLINE_STRIKE, 'del'), (INLINE_ITALIC, 'em'), (INLINE_BOLD, 'strong'))
+
+# 预览页面的外观（页面以外的部分）
+PAGE_CSS = """
+body { margin: 0; padding: 16px; background: #f0f0f0; }
+.gov-page { box-sizing: border-box; margin: 0 auto; background: #fff; color: #000;
+            box-shadow: 0 1px 4px rgba(0, 0, 0, 0.2); }
+.gov-page p { margin: 0; }
+.gov-table { width: 100%; table-layout: fixed; border-collapse: collapse; }
+.gov-table th, .gov-table td { border: 0.5pt solid #000; vertical-align: middle; }
+"""
+
+
+def _style_css(style_key):
+    """一个公文样式的CSS声明，与Word中的直接格式一致"""
+    _, _, font_name, font_size, bold, _ = GOV_STYLES[style_key]
+    p_format = resolved_paragraph_format(style_key)
+    indent = p_format['indent']
+    line_spacing = p_format['line_spacing']
+    space_before = p_format['space_before']
+    space_after = p_format['space_after']
+    return (
+        f"font-family: \"{font_name}\", {CSS_FONT_FALLBACKS[font_name]}; "
+        f"font-size: {font_size.pt:g}pt; font-weight: {'bold' if bold else 'normal'}; "
+        f"line-height: {f'{line_spacing.pt:g}pt' if line_spacing is not None else 'normal'}; "
+        f"text-indent: {indent.pt if indent is not None else 0:g}pt; "
+        f"text-align: {CSS_ALIGNMENTS[p_format['alignment']]}; "
+        f"padding: {space_before.pt if space_before is not None else 0:g}pt 0 "
+        f"{space_after.pt if space_after is not None else 0:g}pt"
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def preview_css():
+    """预览页面的完整样式表：页面尺寸和页边距取自Word文档的基础模板，段落样式取自公文样式表"""
+    section = new_gov_document().sections[0]
+    rules = [
+        PAGE_CSS,
+        f".gov-page {{ width: {section.page_width.mm:.1f}mm; min-height: {section.page_height.mm:.1f}mm; "
+        f"padding: {MARGIN_TOP.mm:g}mm {MARGIN_RIGHT.mm:g}mm {MARGIN_BOTTOM.mm:g}mm {MARGIN_LEFT.mm:g}mm; }}",
+        f".gov-blank {{ height: {LINE_SPACING_28_8.pt:g}pt; }}",
+    ]
+    for style_key in GOV_STYLES:
+        selector = {'table_header': '.gov-table th', 'table_cell': '.gov-table td'}.get(style_key, f".gov-{style_key}")
+        rules.append(f"{selector} {{ {_style_css(style_key)}; }}")
+    return '\n'.join(rules)
+
+
+# ==================== HTML预览 ====================
+BLANK_LINE_HTML = '<p class="gov-blank"></p>'
+
+
+def inline_html(spans):
+    """把正文的行内片段（Paragraph.spans）转换为HTML标记（<strong>、<em>、<del>），规则与Word输出相同"""
+    return markup_inline_spans(spans, HTML_INLINE_TAGS, escape)
+
+
+def _table_html(table_data):
+    """表格（各行列数相同），第一行为表头"""
+    rows = []
+    for i, row in enumerate(table_data):
+        tag = 'th' if i == 0 else 'td'
+        cells = ''.join(f"<{tag}>{escape(text)}</{tag}>" for text in row)
+        rows.append(f"<tr>{cells}</tr>")
+    return f"<table class=\"gov-table\">{''.join(rows)}</table>"
+
+
+def emit_html(blocks, standalone=True, **options):
+    """
+    HTML预览：按公文格式排版块列表
+
+    参数:
+        blocks: 块节点列表（parse_markdown的结果）
+        standalone: True时输出带样式表的完整HTML页面（可直接放入iframe），
+                    False时只输出<div class="gov-page">片段，样式表由preview_css()另行提供
+        options: 其他输出格式的选项（如use_styles），对预览没有影响，忽略
+
+    返回:
+        HTML文本
+    """
+    parts = ['<div class="gov-page">']
+    for style_key, content in layout_blocks(blocks):
+        if style_key == LAYOUT_BLANK:
+            parts.append(BLANK_LINE_HTML)
+        elif style_key == BLOCK_TABLE:
+            parts.append(_table_html(content))
+        elif style_key == BLOCK_PARAGRAPH:
+            parts.append(f"<p class=\"gov-body\">{inline_html(content)}</p>")
+        else:
+            parts.append(f"<p class=\"gov-{style_key}\">{escape(content)}</p>")
+    parts.append('</div>')
+
+    page = '\n'.join(parts)
+    if not standalone:
+        return page
+    return ('<!DOCTYPE html>\n<html lang="zh-CN">\n<head>\n<meta charset="UTF-8">\n'
+            f"<style>{preview_css()}</style>\n</head>\n<body>\n{page}\n</body>\n</html>\n")
+
+
+# ==================== 纯文本 ====================
+def emit_text(blocks, **options):
+    """
+    纯文本输出：去掉格式标记，段落之间换行，表格单元格以制表符分隔
+
+    参数:
+        blocks: 块节点列表
+        options: 其他输出格式的选项，忽略
+
+    返回:
+        文本内容
+    """
+    lines = []
+    for style_key, content in layout_blocks(blocks):
+        if style_key == LAYOUT_BLANK:
+            lines.append('')
+        elif style_key == BLOCK_TABLE:
+            lines.extend('\t'.join(row) for row in content)
+        elif style_key == BLOCK_PARAGRAPH:
+            lines.append(''.join(span.text for span in content))
+        else:
+            lines.append(content)
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+register_emitter('html', emit_html)
+register_emitter('text', emit_text)
+
+
+# ==================== 对外接口 ====================
+def preview_markdown(text, standalone=True):
+    """
+    生成Markdown文本的公文格式HTML预览
+
+    参数:
+        text: Markdown文本内容
+        standalone: 是否输出完整HTML页面
+
+    返回:
+        HTML文本
+    """
+    return emit_html(parse_markdown(text), standalone)
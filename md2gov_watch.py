@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown转政府公文格式 - 监视模式
+监视Markdown文件或目录，保存后自动重新转换。进程常驻，公文基础模板和增量转换器一直保持预热，
+每次只转换内容真正变化的文件，且只重新排版其中改动过的块。
+
+安装了watchdog时使用操作系统的文件事件（inotify、FSEvents、ReadDirectoryChangesW），
+否则定时比较文件的修改时间和大小。编辑器一次保存常触发多个事件，最后一个事件之后
+安静一段时间（去抖）才开始转换。
+"""
+
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # 未安装watchdog时退回轮询
+    Observer = None
+    FileSystemEventHandler = object
+
+from md2gov_docx import (MARKDOWN_SUFFIXES, IncrementalConverter, atomic_output, find_markdown_files,
+                         parse_markdown, render_blocks)
+
+# 默认配置
+DEFAULT_DEBOUNCE = 0.3          # 最后一次文件变化后等待多久再转换（秒）
+DEFAULT_POLL_INTERVAL = 0.5     # 轮询模式下检查文件状态的间隔（秒）
+
+
+# ==================== 监视目标 ====================
+class WatchTarget:
+    """
+    监视的输入及其输出位置
+
+    - 单文件：input_path为.md文件，output_path为.docx文件
+    - 目录（批量）：input_path为目录，按相对路径在output_path下生成同名.docx，保持目录结构
+    """
+
+    def __init__(self, input_path, output_path, directory=False, pdf=False):
+        self.input_path = Path(input_path).resolve()
+        self.output_path = Path(output_path)
+        self.directory = directory
+        self.pdf = pdf
+
+    @property
+    def watch_dir(self):
+        """需要监视的目录：编辑器常以"写临时文件再改名"的方式保存，单文件也要监视其所在目录"""
+        return self.input_path if self.directory else self.input_path.parent
+
+    def sources(self):
+        """当前所有需要转换的输入文件"""
+        if self.directory:
+            return [path.resolve() for path in find_markdown_files(self.input_path)]
+        return [self.input_path] if self.input_path.is_file() else []
+
+    def output_for(self, path):
+        """
+        输入文件对应的输出路径
+
+        返回:
+            {输出格式: 路径}，path不是本目标的输入文件时返回None
+        """
+        path = Path(path)
+        if self.directory:
+            if path.suffix.lower() not in MARKDOWN_SUFFIXES:
+                return None
+            try:
+                relative = path.relative_to(self.input_path)
+            except ValueError:
+                return None
+            docx_path = self.output_path / relative.with_suffix('.docx')
+        elif path == self.input_path:
+            docx_path = self.output_path
+        else:
+            return None
+
+        if self.pdf:
+            return {'docx': docx_path, 'pdf': docx_path.with_suffix('.pdf')}
+        return {'docx': docx_path}
+
+
+# ==================== 变化收集与去抖 ====================
+class ChangeCollector:
+    """收集变化的文件路径；最后一次变化之后安静debounce秒，才把这一批路径交出去"""
+
+    def __init__(self, debounce=DEFAULT_DEBOUNCE):
+        self.debounce = debounce
+        self._paths = set()
+        self._last_change = 0.0
+        self._condition = threading.Condition()
+
+    def add(self, path):
+        with self._condition:
+            self._paths.add(Path(path))
+            self._last_change = time.monotonic()
+            self._condition.notify()
+
+    def wait(self, stop_event=None, timeout=1.0):
+        """
+        等待下一批变化
+
+        参数:
+            stop_event: threading.Event，可选，被设置时尽快返回
+            timeout: 每次检查stop_event的间隔（秒）
+
+        返回:
+            变化的路径集合；stop_event被设置时返回空集合
+        """
+        with self._condition:
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    return set()
+                if self._paths:
+                    remaining = self._last_change + self.debounce - time.monotonic()
+                    if remaining <= 0:
+                        paths, self._paths = self._paths, set()
+                        return paths
+                    self._condition.wait(min(remaining, timeout))
+                else:
+                    self._condition.wait(timeout)
+
+
+class _EventHandler(FileSystemEventHandler):
+    """把watchdog的文件事件转交给ChangeCollector（改名保存时取目标路径）"""
+
+    def __init__(self, collector):
+        super().__init__()
+        self.collector = collector
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        path = getattr(event, 'dest_path', '') or event.src_path
+        if isinstance(path, bytes):
+            path = os.fsdecode(path)
+        self.collector.add(os.path.abspath(path))
+
+
+def _poll_changes(targets, collector, interval, stop_event):
+    """轮询模式：定时比较输入文件的修改时间和大小"""
+    def snapshot():
+        states = {}
+        for target in targets:
+            for path in target.sources():
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                states[path] = (stat.st_mtime_ns, stat.st_size)
+        return states
+
+    previous = snapshot()
+    while not stop_event.wait(interval):
+        current = snapshot()
+        for path, state in current.items():
+            if previous.get(path) != state:
+                collector.add(path)
+        previous = current
+
+
+# ==================== 转换 ====================
+class WatchConverter:
+    """
+    监视模式的常驻转换器：同一个增量转换器服务所有文件，内容未变的保存（如只改了修改时间）直接跳过
+    """
+
+    def __init__(self, use_styles=False):
+        self.use_styles = use_styles
+        self.converter = IncrementalConverter()
+        self._digests = {}  # 输入路径 -> 上次转换时的内容哈希
+
+    def convert(self, md_path, outputs):
+        """
+        转换一个文件并写出结果
+
+        参数:
+            md_path: 输入文件路径
+            outputs: {输出格式: 路径}
+
+        返回:
+            True表示已转换，False表示内容未变化而跳过
+        """
+        data = Path(md_path).read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        if self._digests.get(md_path) == digest and all(Path(path).exists() for path in outputs.values()):
+            return False
+
+        # 只解析一次，Word文档和PDF共用同一份块列表
+        blocks = parse_markdown(data.decode('utf-8'))
+        _write_atomic(outputs['docx'], self.converter.convert_blocks(blocks, self.use_styles))
+        if 'pdf' in outputs:
+            _write_atomic(outputs['pdf'], render_blocks(blocks, 'pdf'))
+        self._digests[md_path] = digest
+        return True
+
+
+def _write_atomic(path, data):
+    """先写临时文件再替换，打开着输出文件的阅读器不会读到写了一半的文件"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_output(path) as f:
+        f.write(data)
+
+
+def _convert_paths(paths, targets, converter):
+    """转换一批变化的文件，逐个输出结果；返回失败的文件数"""
+    failed = 0
+    for path in sorted(paths):
+        for target in targets:
+            outputs = target.output_for(path)
+            if outputs is None:
+                continue
+            if not path.is_file():
+                break
+            started = time.perf_counter()
+            try:
+                converted = converter.convert(path, outputs)
+            except Exception as e:
+                failed += 1
+                print(f"❌ [{time.strftime('%H:%M:%S')}] {path}: {type(e).__name__}: {e}", flush=True)
+                break
+            if converted:
+                elapsed = (time.perf_counter() - started) * 1000
+                print(f"✅ [{time.strftime('%H:%M:%S')}] {path} -> {outputs['docx']} ({elapsed:.0f}ms)", flush=True)
+            break
+    return failed
+
+
+# ==================== 对外接口 ====================
+def watch(targets, use_styles=False, debounce=DEFAULT_DEBOUNCE, poll_interval=DEFAULT_POLL_INTERVAL,
+          use_events=True, stop_event=None):
+    """
+    监视并自动转换，直到按Ctrl+C或stop_event被设置
+
+    启动时先把所有输入转换一遍（同时预热转换器），之后只转换变化的文件。
+
+    参数:
+        targets: WatchTarget列表
+        use_styles: 是否使用公文命名样式代替直接格式
+        debounce: 去抖时间（秒）
+        poll_interval: 轮询间隔（秒），只在轮询模式下使用
+        use_events: 是否优先使用文件事件（需要watchdog），False时总是轮询
+        stop_event: threading.Event，可选，用于从其他线程停止监视
+
+    返回:
+        退出码（0）
+    """
+    stop_event = stop_event or threading.Event()
+    converter = WatchConverter(use_styles)
+    collector = ChangeCollector(debounce)
+
+    initial = [path for target in targets for path in target.sources()]
+    _convert_paths(initial, targets, converter)
+
+    observer = None
+    if use_events and Observer is not None:
+        observer = Observer()
+        handler = _EventHandler(collector)
+        for directory in {target.watch_dir for target in targets}:
+            observer.schedule(handler, str(directory), recursive=any(t.directory for t in targets))
+        observer.start()
+        mode = '文件事件'
+    else:
+        threading.Thread(target=_poll_changes, args=(targets, collector, poll_interval, stop_event),
+                         name='md2gov-watch-poll', daemon=True).start()
+        mode = f'每{poll_interval:g}秒检查一次'
+
+    for target in targets:
+        print(f"👀 正在监视 {target.input_path}（{mode}），按 Ctrl+C 停止", flush=True)
+
+    try:
+        while not stop_event.is_set():
+            paths = collector.wait(stop_event)
+            if paths:
+                _convert_paths(paths, targets, converter)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        if observer is not None:
+            observer.stop()
+            observer.join()
+    print("\n已停止监视", flush=True)
+    return 0
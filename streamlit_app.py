@@ -5,11 +5,26 @@ GovDoc - 政府公文格式转换工具
 专业的Markdown到公文格式转换服务
 """
 
+import functools
+import hashlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
-import tempfile
-import os
-from pathlib import Path
-from md2gov_docx import convert_markdown_to_gov_docx
+import streamlit.components.v1 as components
+from conversion_cache import ConversionCache, make_cache_key
+from md2gov_docx import IncrementalConverter, write_batch_zip
+from md2gov_preview import preview_markdown
+
+# 后台转换线程数（所有会话共享）
+CONVERSION_THREADS = 2
+# 后台转换进行中时页面刷新状态的间隔（秒）
+POLL_INTERVAL = 0.3
+# 排版预览区域的高度（像素）
+PREVIEW_HEIGHT = 600
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
 
 # 页面配置
 st.set_page_config(
@@ -255,6 +270,150 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+@st.cache_resource
+def get_conversion_cache():
+    """所有会话共享的转换结果缓存，重复点击转换时直接返回已生成的文档"""
+    return ConversionCache()
+
+
+def get_incremental_converter():
+    """当前会话的增量转换器：编辑后再次转换时只重新排版改动过的段落和表格"""
+    if 'incremental_converter' not in st.session_state:
+        st.session_state.incremental_converter = IncrementalConverter()
+    return st.session_state.incremental_converter
+
+
+@st.cache_resource
+def get_conversion_executor():
+    """所有会话共享的后台转换线程池：转换期间页面照常响应，操作其他控件引起的重新运行也不会中断转换"""
+    return ThreadPoolExecutor(max_workers=CONVERSION_THREADS, thread_name_prefix='md2gov')
+
+
+# ==================== 后台转换任务 ====================
+# 每个标签页在会话状态中占一个槽位，保存最近一次转换任务：
+# {'key': 输入内容摘要, 'future': 进行中的转换, 'data': 结果字节, 'error': 是否失败,
+#  'progress': 0~1, 'errors': 失败的文件名, 'summary': 完成提示}
+# 结果字节每个会话只保存一份，每次重新运行直接交给下载按钮，不再重新转换
+
+def submit_conversion(slot, key, job):
+    """
+    在后台线程中执行转换，输入内容不变时复用已有的任务和结果
+
+    参数:
+        slot: 会话状态中的槽位名
+        key: 输入内容摘要
+        job: job(task) -> 结果字节，在后台线程中执行，不能访问st.*（所需对象在页面线程中取好传入）
+    """
+    task = st.session_state.get(slot)
+    if task is not None and task['key'] == key and not task['error']:
+        return
+    task = {'key': key, 'future': None, 'data': None, 'error': False, 'progress': 0.0, 'errors': [],
+            'summary': None}
+    task['future'] = get_conversion_executor().submit(job, task)
+    st.session_state[slot] = task
+
+
+def collect_conversion(slot):
+    """
+    取回已完成的后台转换结果
+
+    返回:
+        任务状态；没有任务时返回None
+    """
+    task = st.session_state.get(slot)
+    if task is not None and task['future'] is not None and task['future'].done():
+        try:
+            task['data'] = task['future'].result()
+        except Exception:
+            task['error'] = True
+        task['future'] = None
+    return task
+
+
+def conversion_pending():
+    """当前会话是否有进行中的后台转换"""
+    return any(task is not None and task['future'] is not None
+               for task in (st.session_state.get(slot) for slot in ('text_task', 'file_task', 'batch_task')))
+
+
+def render_conversion(slot, key, label, file_name, mime):
+    """
+    显示标签页的转换状态：进行中显示进度，完成后显示下载按钮
+
+    参数:
+        slot: 会话状态中的槽位名
+        key: 当前输入内容摘要，与任务不一致时提示结果已过期
+        label, file_name, mime: 下载按钮参数
+    """
+    task = collect_conversion(slot)
+    if task is None:
+        return
+
+    if task['future'] is not None:
+        st.progress(task['progress'], text="⏳ 正在后台转换，可继续操作页面，完成后自动显示下载按钮")
+        return
+    if task['error']:
+        st.error("❌ 转换失败，请检查Markdown格式是否正确")
+        return
+
+    if key == task['key']:
+        st.success(f"✅ {task['summary'] or '转换成功！'}")
+    else:
+        st.warning("⚠️ 内容已修改，以下是上次转换的结果，重新点击转换可获取最新文档")
+    st.download_button(
+        label=label,
+        data=task['data'],
+        file_name=file_name,
+        mime=mime,
+        key=f"{slot}_download",
+        use_container_width=True
+    )
+
+
+def content_key(data):
+    """上传文件内容的摘要"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def convert_text_job(cache, text, converter, task):
+    """后台任务：转换粘贴的文本（共享缓存命中时直接返回）"""
+    return cache.get_or_convert(text, converter=converter)
+
+
+def convert_upload_job(cache, data, task):
+    """后台任务：转换上传的文件"""
+    return cache.get_or_convert(data.decode('utf-8'))
+
+
+def convert_batch_job(cache, documents, task):
+    """后台任务：批量转换并打包为ZIP，进度和失败文件写入任务状态"""
+    def report(done, total, name, error):
+        if error is not None:
+            task['errors'].append(name)
+        task['progress'] = done / total
+
+    # 每篇完成后立即写入压缩包，共享缓存中已有的文档直接复用
+    buffer = io.BytesIO()
+    failed = write_batch_zip(documents, buffer, converter=cache.get_or_convert, progress=report)
+    succeeded = len(documents) - failed
+    if not succeeded:
+        raise ValueError('全部文件转换失败')
+    task['summary'] = f"转换完成：成功 {succeeded} 个" + (f"，失败 {failed} 个" if failed else "")
+    return buffer.getvalue()
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def render_preview(text):
+    """公文格式HTML预览：只解析、不生成Word文档，相同内容直接复用"""
+    return preview_markdown(text)
+
+
+def show_preview(text):
+    """在可折叠区域中显示排版预览，内容在独立的iframe中渲染，不受页面样式影响"""
+    with st.expander("👀 排版预览", expanded=True):
+        components.html(render_preview(text), height=PREVIEW_HEIGHT, scrolling=True)
+
+
 def main():
     # 简洁的头部
     st.markdown("""
@@ -266,7 +425,7 @@ def main():
     """, unsafe_allow_html=True)
     
     # 创建标签页（默认显示粘贴文本）
-    tab1, tab2 = st.tabs(["📝 粘贴文本", "📁 上传文件"])
+    tab1, tab2, tab3 = st.tabs(["📝 粘贴文本", "📁 上传文件", "📚 批量转换"])
     
     # 标签页1: 粘贴文本（默认）
     with tab1:
@@ -289,46 +448,22 @@ def main():
             if st.button("🗑️ 清空", key="clear_text", use_container_width=True):
                 st.rerun()
         
+        text_key = make_cache_key(markdown_text)
         with col2:
             if st.button("🚀 转换并下载", key="convert_text", use_container_width=True, type="primary"):
                 if not markdown_text.strip():
                     st.error("❌ 请输入Markdown文本")
                 else:
-                    with st.spinner("正在转换中..."):
-                        # 创建临时文件
-                        with tempfile.NamedTemporaryFile(mode='w', suffix='.md', delete=False, encoding='utf-8') as tmp_input:
-                            tmp_input.write(markdown_text)
-                            input_path = tmp_input.name
-                        
-                        output_path = input_path.replace('.md', '.docx')
-                        
-                        # 转换文档
-                        success = convert_markdown_to_gov_docx(input_path, output_path)
-                        
-                        if success:
-                            # 读取生成的文件
-                            with open(output_path, 'rb') as f:
-                                docx_data = f.read()
-                            
-                            st.success("✅ 转换成功！")
-                            
-                            # 直接下载，不需要再点击
-                            st.download_button(
-                                label="📥 下载Word文档",
-                                data=docx_data,
-                                file_name="公文格式文档.docx",
-                                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                use_container_width=True
-                            )
-                            
-                            # 清理临时文件
-                            try:
-                                os.remove(input_path)
-                                os.remove(output_path)
-                            except:
-                                pass
-                        else:
-                            st.error("❌ 转换失败，请检查Markdown格式是否正确")
+                    # 转换文档（全程在内存中完成），增量转换器只能在页面线程中从会话状态取出
+                    job = functools.partial(convert_text_job, get_conversion_cache(), markdown_text,
+                                            get_incremental_converter().convert)
+                    submit_conversion('text_task', text_key, job)
+            
+            render_conversion('text_task', text_key, "📥 下载Word文档", "公文格式文档.docx", DOCX_MIME)
+        
+        # 文本框内容变化后页面重新运行，预览随之刷新，转换前即可检查排版
+        if markdown_text.strip():
+            show_preview(markdown_text)
     
     # 标签页2: 上传文件
     with tab2:
@@ -350,42 +485,66 @@ def main():
             
             st.markdown("<br>", unsafe_allow_html=True)
             
+            file_data = uploaded_file.getvalue()
+            file_key = content_key(file_data)
             if st.button("🚀 转换并下载", key="convert_file", use_container_width=True):
-                with st.spinner("正在转换中..."):
-                    # 创建临时文件
-                    with tempfile.NamedTemporaryFile(mode='wb', suffix='.md', delete=False) as tmp_input:
-                        tmp_input.write(uploaded_file.getvalue())
-                        input_path = tmp_input.name
-                    
-                    output_path = input_path.replace('.md', '.docx')
-                    
-                    # 转换文档
-                    success = convert_markdown_to_gov_docx(input_path, output_path)
-                    
-                    if success:
-                        # 读取生成的文件
-                        with open(output_path, 'rb') as f:
-                            docx_data = f.read()
-                        
-                        st.success("✅ 转换成功！")
-                        
-                        # 直接下载
-                        st.download_button(
-                            label="📥 下载Word文档",
-                            data=docx_data,
-                            file_name="公文格式文档.docx",
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                            use_container_width=True
-                        )
-                        
-                        # 清理临时文件
-                        try:
-                            os.remove(input_path)
-                            os.remove(output_path)
-                        except:
-                            pass
-                    else:
-                        st.error("❌ 转换失败，请检查Markdown格式是否正确")
+                # 转换文档（全程在内存中完成）
+                job = functools.partial(convert_upload_job, get_conversion_cache(), file_data)
+                submit_conversion('file_task', file_key, job)
+            
+            render_conversion('file_task', file_key, "📥 下载Word文档", "公文格式文档.docx", DOCX_MIME)
+            
+            try:
+                show_preview(file_data.decode('utf-8'))
+            except UnicodeDecodeError:
+                st.warning("⚠️ 文件不是UTF-8编码，无法预览")
+    
+    
+    # 标签页3: 批量转换
+    with tab3:
+        st.markdown("""
+        <div style="text-align: center; margin: 1rem 0; padding: 1rem; background: #ebf8ff; border-radius: 8px;">
+            <p style="margin: 0; color: #2c5282; font-size: 0.95rem;">📚 一次选择多个文件，转换后打包为ZIP下载</p>
+            <p style="margin: 0.3rem 0 0 0; color: #718096; font-size: 0.85rem;">支持 .md、.markdown、.txt 格式</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        uploaded_files = st.file_uploader(
+            "选择多个文件",
+            type=['md', 'markdown', 'txt'],
+            accept_multiple_files=True,
+            label_visibility="collapsed",
+            key="batch_files"
+        )
+        
+        if uploaded_files:
+            total_kb = sum(f.size for f in uploaded_files) / 1024
+            st.success(f"✅ 已选择 **{len(uploaded_files)}** 个文件（共 {total_kb:.1f} KB）")
+            
+            st.markdown("<br>", unsafe_allow_html=True)
+            
+            batch_digest = hashlib.sha256()
+            for f in uploaded_files:
+                batch_digest.update(f"{f.name}\n{content_key(f.getvalue())}\n".encode('utf-8'))
+            batch_key = batch_digest.hexdigest()
+            
+            if st.button("🚀 批量转换并打包", key="convert_batch", use_container_width=True):
+                documents = []
+                for f in uploaded_files:
+                    try:
+                        documents.append((f.name, f.getvalue().decode('utf-8')))
+                    except UnicodeDecodeError:
+                        st.error(f"❌ 文件编码错误，请使用UTF-8编码：{f.name}")
+                
+                if documents:
+                    job = functools.partial(convert_batch_job, get_conversion_cache(), documents)
+                    submit_conversion('batch_task', batch_key, job)
+            
+            batch_task = st.session_state.get('batch_task')
+            render_conversion('batch_task', batch_key, "📥 下载ZIP压缩包", "公文格式文档.zip", "application/zip")
+            if batch_task is not None and batch_task['future'] is None:
+                for name in batch_task['errors']:
+                    st.error(f"❌ {name} 转换失败，请检查Markdown格式是否正确")
     
     
     # 简洁页脚
@@ -397,6 +556,11 @@ def main():
         </p>
     </div>
     """, unsafe_allow_html=True)
+    
+    # 有后台转换进行中时定时重新运行页面，刷新进度并在完成后显示下载按钮
+    if conversion_pending():
+        time.sleep(POLL_INTERVAL)
+        st.rerun()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量转换持久缓存的测试（python -m pytest test_conversion_cache.py）
+"""
+
+import os
+
+import conversion_cache
+from conversion_cache import BatchCache
+from md2gov_docx import convert_directory
+
+
+def _run_batch(in_dir, out_dir, cache_dir):
+    cache = BatchCache(cache_dir)
+    return convert_directory(in_dir, out_dir, jobs=1, cache=cache)
+
+
+def test_unchanged_files_are_skipped(tmp_path):
+    in_dir = tmp_path / 'in'
+    in_dir.mkdir()
+    (in_dir / 'a.md').write_text('# 标题\n\n正文\n', encoding='utf-8')
+
+    first = _run_batch(in_dir, tmp_path / 'out', tmp_path / 'cache')
+    second = _run_batch(in_dir, tmp_path / 'out', tmp_path / 'cache')
+
+    assert (first['succeeded'], first['cached']) == (1, 0)
+    assert (second['succeeded'], second['cached']) == (1, 1)
+
+
+def test_output_format_version_bump_rewrites_outputs(tmp_path, monkeypatch):
+    in_dir = tmp_path / 'in'
+    in_dir.mkdir()
+    md_path = in_dir / 'a.md'
+    md_path.write_text('# 标题\n\n正文\n', encoding='utf-8')
+    docx_path = tmp_path / 'out' / 'a.docx'
+
+    _run_batch(in_dir, tmp_path / 'out', tmp_path / 'cache')
+
+    # 模拟旧版排版留下的输出：索引中记录的输出状态与现有文件一致，同版本时直接跳过
+    docx_path.write_bytes(b'stale')
+    cache = BatchCache(tmp_path / 'cache')
+    cache._record(os.path.abspath(md_path), md_path.stat(), conversion_cache.file_digest(md_path),
+                  False, {'docx': docx_path})
+    cache.save()
+    assert _run_batch(in_dir, tmp_path / 'out', tmp_path / 'cache')['cached'] == 1
+    assert docx_path.read_bytes() == b'stale'
+
+    monkeypatch.setattr(conversion_cache, 'OUTPUT_FORMAT_VERSION', conversion_cache.OUTPUT_FORMAT_VERSION + 1)
+    summary = _run_batch(in_dir, tmp_path / 'out', tmp_path / 'cache')
+
+    assert (summary['succeeded'], summary['cached']) == (1, 0)
+    assert docx_path.read_bytes().startswith(b'PK')
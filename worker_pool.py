@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown转政府公文格式 - 常驻转换进程池
+python-docx的排版工作是CPU密集型且持有GIL，同一进程内的并发请求只能排队执行；
+进程池预先启动若干已导入python-docx、已解析公文基础模板的工作进程，请求线程只负责分发
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+
+# 默认配置
+DEFAULT_POOL_WORKERS = os.cpu_count() or 2
+DEFAULT_JOB_TIMEOUT = 60            # 单个转换任务的超时时间（秒）
+DEFAULT_MAX_JOBS_PER_WORKER = 200   # 工作进程处理多少个任务后重启，限制内存增长
+
+# 工作进程预先导入的模块（forkserver模式下由服务进程导入一次，之后fork出的进程直接继承）
+PRELOAD_MODULES = ['md2gov_docx']
+
+
+class WorkerPoolError(Exception):
+    """进程池转换失败"""
+
+
+class WorkerTimeoutError(WorkerPoolError):
+    """转换超时，执行该任务的工作进程已被终止并替换"""
+
+
+class WorkerPoolBusyError(WorkerPoolError):
+    """等待空闲工作进程超时"""
+
+
+def _worker_main(conn):
+    """
+    工作进程主循环：预热后逐个接收(Markdown文本, 是否使用命名样式)，返回转换结果
+    收到None或父进程断开时退出
+    """
+    from md2gov_docx import convert_markdown_with_stats, new_gov_document
+
+    # 预热：解析公文基础模板，第一个任务不再承担这部分开销
+    new_gov_document()
+
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+
+        text, use_styles = task
+        try:
+            data, stats = convert_markdown_with_stats(text, use_styles)
+            conn.send((True, data, stats.to_dict()))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}", None))
+
+
+def _default_context():
+    """优先使用forkserver：工作进程从干净的服务进程fork，避免在多线程的Web进程中直接fork"""
+    methods = multiprocessing.get_all_start_methods()
+    if 'forkserver' in methods:
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(PRELOAD_MODULES)
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+class _Worker:
+    """一个工作进程及其通信管道"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def stop(self, graceful=True):
+        """停止工作进程：正常退役时先通知其退出，超时或异常时直接终止"""
+        if graceful and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ConversionWorkerPool:
+    """
+    常驻转换进程池
+
+    - 启动时预先创建workers个工作进程，每个进程同时只处理一个任务
+    - 任务超时后终止对应工作进程并补充新进程，调用方收到WorkerTimeoutError
+    - 每个工作进程处理max_jobs_per_worker个任务后退役并替换，限制内存增长
+    - convert()线程安全，可直接在Flask的请求线程中调用
+    """
+
+    def __init__(self, workers=DEFAULT_POOL_WORKERS, timeout=DEFAULT_JOB_TIMEOUT,
+                 max_jobs_per_worker=DEFAULT_MAX_JOBS_PER_WORKER, context=None):
+        """
+        参数:
+            workers: 工作进程数（即最大并发转换数）
+            timeout: 单个任务的超时时间（秒），同时也是等待空闲工作进程的最长时间
+            max_jobs_per_worker: 工作进程处理多少个任务后重启，0表示不重启
+            context: multiprocessing上下文，默认优先使用forkserver
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._context = context or _default_context()
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.recycled = 0
+
+        # spawn/forkserver会在工作进程中重新导入主模块（如app.py），
+        # 此时不能再启动工作进程，只有最外层进程立即预启动
+        if multiprocessing.current_process().name == 'MainProcess':
+            self.start()
+
+    def start(self):
+        """启动全部工作进程（重复调用无副作用）"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.workers):
+            self._idle.put(_Worker(self._context))
+
+    # ---------- 对外接口 ----------
+    def convert(self, text, use_styles=False, stats=None):
+        """
+        在工作进程中转换Markdown文本，用法同convert_markdown_string
+
+        参数:
+            text: Markdown文本内容
+            use_styles: 是否使用公文命名样式代替直接格式
+            stats: ConversionStats，可选，填入工作进程中记录的各阶段耗时和计数
+
+        返回:
+            docx文件的字节内容
+        """
+        if self._closed:
+            raise WorkerPoolError('进程池已关闭')
+        self.start()
+
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise WorkerPoolBusyError('没有空闲的转换进程')
+
+        try:
+            worker.conn.send((text, use_styles))
+            if not worker.conn.poll(self.timeout):
+                self._replace(worker, graceful=False)
+                worker = None
+                with self._lock:
+                    self.timeouts += 1
+                raise WorkerTimeoutError(f'转换超过{self.timeout}秒未完成')
+            ok, payload, stats_data = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            # 工作进程意外退出（如内存不足被系统终止）
+            if worker is not None:
+                self._replace(worker, graceful=False)
+                worker = None
+            with self._lock:
+                self.failed += 1
+            raise WorkerPoolError(f'转换进程异常退出: {e}')
+        finally:
+            if worker is not None:
+                self._release(worker)
+
+        with self._lock:
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+        if not ok:
+            raise WorkerPoolError(payload)
+        if stats is not None:
+            stats.load(stats_data)
+        return payload
+
+    def stats(self):
+        """返回进程池状态"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'idle': self._idle.qsize(),
+                'completed': self.completed,
+                'failed': self.failed,
+                'timeouts': self.timeouts,
+                'recycled': self.recycled,
+            }
+
+    def close(self):
+        """关闭进程池：停止所有空闲工作进程（正在执行的任务完成后其进程随主进程退出）"""
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+
+    # ---------- 工作进程管理 ----------
+    def _release(self, worker):
+        """任务结束后归还工作进程，达到任务数上限时退役并替换"""
+        worker.jobs += 1
+        if self.max_jobs_per_worker and worker.jobs >= self.max_jobs_per_worker:
+            with self._lock:
+                self.recycled += 1
+            self._replace(worker)
+            return
+        if self._closed:
+            worker.stop()
+            return
+        self._idle.put(worker)
+
+    def _replace(self, worker, graceful=True):
+        """停止工作进程并补充一个新进程"""
+        worker.stop(graceful)
+        if not self._closed:
+            self._idle.put(_Worker(self._context))